@@ -0,0 +1,264 @@
+#=================================================================================================#
+# throughput benchmark of generator and discriminator architectures
+#
+# python benchmark.py --architecture dcgan --resolution 64 --min_filters 32 --data_format channels_last
+#
+# times forward, backward (forward + gradients) and full gan.Model train steps on synthetic inputs
+# and reports step latency percentiles, images/sec and peak memory as JSON
+#
+# process_peak_memory is the peak of the whole process so far (accelerator allocator or max rss),
+# which can't be reset, so it is cumulative over benchmarks run earlier in the same process.
+# run one benchmark per process (e.g. --benchmarks train) for the peak of that benchmark alone
+#
+# "upsampling" compares native channels_last ops.upsampling2d / ops.unpooling2d
+# with the transpose-based path (NHWC -> NCHW -> op -> NHWC) at the input of each upsampling layer
+# of the resnet generator
+#
+# "shared_discriminator_pass" compares train steps with reals and fakes
+# in separate discriminator calls and in one concatenated call
+#=================================================================================================#
+
+import tensorflow as tf
+import numpy as np
+import argparse
+import resource
+import json
+import time
+from models import gan
+from networks import dcgan, resnet, ops
+from data import synthetic
+from utils import attr_dict
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--architecture", type=str, choices=["dcgan", "resnet"], default="dcgan", help="network architecture")
+parser.add_argument("--resolution", type=int, default=64, help="image resolution")
+parser.add_argument("--min_filters", type=int, default=32, help="number of filters at max resolution")
+parser.add_argument("--max_filters", type=int, default=512, help="number of filters at min resolution")
+parser.add_argument("--latent_size", type=int, default=128, help="latent size")
+parser.add_argument('--data_format', type=str, choices=["channels_first", "channels_last"], default="channels_last", help="data_format")
+parser.add_argument("--batch_size", type=int, default=64, help="batch size")
+parser.add_argument("--num_steps", type=int, default=100, help="number of timed steps")
+parser.add_argument("--num_warmup_steps", type=int, default=10, help="number of untimed steps before timing")
+parser.add_argument("--benchmarks", type=str, nargs="+", default=["forward", "backward", "train"],
+                    choices=["forward", "backward", "train", "upsampling", "shared_discriminator_pass"], help="benchmarks to run")
+parser.add_argument("--filename", type=str, default=None, help="json filename (stdout if not specified)")
+parser.add_argument('--gpu', type=str, default="0", help="gpu id")
+args = parser.parse_args()
+
+networks = dict(dcgan=dcgan, resnet=resnet)
+
+gpu_available = tf.test.is_gpu_available()
+
+config = tf.ConfigProto(
+    gpu_options=tf.GPUOptions(
+        visible_device_list=args.gpu,
+        allow_growth=True
+    ),
+    log_device_placement=False,
+    allow_soft_placement=True
+)
+
+
+def network_kwargs():
+
+    return dict(
+        min_resolution=4,
+        max_resolution=args.resolution,
+        min_filters=args.min_filters,
+        max_filters=args.max_filters,
+        data_format=args.data_format
+    )
+
+
+def image_shape():
+
+    return ([3, args.resolution, args.resolution] if args.data_format == "channels_first" else
+            [args.resolution, args.resolution, 3])
+
+
+def process_peak_memory():
+    ''' peak memory in bytes since this process started,
+        of accelerator if available, otherwise of host (max resident set size)
+    '''
+
+    if gpu_available:
+        return int(tf.get_default_session().run(tf.contrib.memory_stats.MaxBytesInUse()))
+
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def time_steps(fetches, feed_dict=None):
+
+    session = tf.get_default_session()
+
+    for _ in range(args.num_warmup_steps):
+        session.run(fetches, feed_dict=feed_dict)
+
+    latencies = []
+
+    for _ in range(args.num_steps):
+        start = time.time()
+        session.run(fetches, feed_dict=feed_dict)
+        latencies.append(time.time() - start)
+
+    latencies = np.array(latencies)
+
+    return dict(
+        latency_mean=float(np.mean(latencies)),
+        latency_p50=float(np.percentile(latencies, 50)),
+        latency_p90=float(np.percentile(latencies, 90)),
+        latency_p99=float(np.percentile(latencies, 99)),
+        images_per_sec=float(args.batch_size / np.mean(latencies)),
+        process_peak_memory=process_peak_memory()
+    )
+
+
+def benchmark_network(network, backward):
+
+    with tf.Graph().as_default():
+
+        if network == "generator":
+
+            inputs = tf.random_normal([args.batch_size, args.latent_size])
+            outputs = networks[args.architecture].Generator(**network_kwargs())(inputs=inputs, training=True)
+
+        else:
+
+            inputs = tf.random_uniform([args.batch_size] + image_shape())
+            outputs = networks[args.architecture].Discriminator(**network_kwargs())(inputs=inputs, training=True)
+
+        fetches = [outputs.op] + tf.get_collection(tf.GraphKeys.UPDATE_OPS)
+
+        if backward:
+            fetches += [gradient.op for gradient in tf.gradients(ys=outputs, xs=tf.trainable_variables())]
+
+        with tf.Session(config=config) as session:
+
+            session.run(tf.global_variables_initializer())
+
+            return time_steps(fetches)
+
+
+def benchmark_train(shared_discriminator_pass=False):
+
+    with tf.Graph().as_default():
+
+        gan_model = gan.Model(
+            dataset=synthetic.Dataset(
+                image_size=[args.resolution, args.resolution],
+                data_format=args.data_format
+            ),
+            generator=networks[args.architecture].Generator(**network_kwargs()),
+            discriminator=networks[args.architecture].Discriminator(**network_kwargs()),
+            loss_function=gan.Model.LossFunction.NS_GAN,
+            gradient_penalty=gan.Model.GradientPenalty.ONE_CENTERED,
+            hyper_params=attr_dict.AttrDict(
+                latent_size=args.latent_size,
+                gradient_coefficient=1.0,
+                learning_rate=0.0002,
+                beta1=0.5,
+                beta2=0.999
+            ),
+            shared_discriminator_pass=shared_discriminator_pass,
+            name="benchmark"
+        )
+
+        with tf.Session(config=config) as session:
+
+            session.run(tf.global_variables_initializer())
+            session.run(gan_model.metrics_initializer)
+
+            gan_model.dataset.initialize(
+                filenames=[],
+                num_epochs=args.num_warmup_steps + args.num_steps,
+                batch_size=args.batch_size,
+                buffer_size=1
+            )
+
+            return time_steps(
+                fetches=[gan_model.generator_train_op, gan_model.discriminator_train_op],
+                feed_dict={
+                    gan_model.batch_size: args.batch_size,
+                    gan_model.training: True
+                }
+            )
+
+
+def benchmark_upsampling():
+
+    results = {}
+
+    # resnet generator upsamples the output of the previous layer in each deconv2d_block,
+    # so layer "index" upsamples (min_resolution << (index - 1)) pixels of (max_filters >> (index - 1)) filters
+    generator = resnet.Generator(**network_kwargs())
+
+    for index in range(1, generator.num_layers - 1):
+
+        resolution = generator.min_resolution << (index - 1)
+        filters = generator.max_filters >> (index - 1)
+
+        for name, upsampling in [
+            ("upsampling2d", lambda inputs, data_format: ops.upsampling2d(inputs, [2, 2], data_format)),
+            ("unpooling2d", lambda inputs, data_format: ops.unpooling2d(inputs, [2, 2], data_format))
+        ]:
+
+            with tf.Graph().as_default():
+
+                inputs = tf.Variable(tf.random_uniform([args.batch_size, resolution, resolution, filters]))
+
+                native = upsampling(inputs, "channels_last")
+
+                transposed = tf.transpose(inputs, [0, 3, 1, 2])
+                transposed = upsampling(transposed, "channels_first")
+                transposed = tf.transpose(transposed, [0, 2, 3, 1])
+
+                with tf.Session(config=config) as session:
+
+                    session.run(tf.global_variables_initializer())
+
+                    results["{}_{}x{}".format(name, resolution, resolution)] = dict(
+                        native=time_steps(native.op),
+                        transposed=time_steps(transposed.op)
+                    )
+
+    return results
+
+
+results = dict(config=vars(args))
+
+for benchmark in args.benchmarks:
+
+    if benchmark in ["forward", "backward"]:
+
+        for network in ["generator", "discriminator"]:
+
+            results["{}_{}".format(network, benchmark)] = benchmark_network(
+                network=network,
+                backward=benchmark == "backward"
+            )
+
+    elif benchmark == "train":
+
+        results["train"] = benchmark_train()
+
+    elif benchmark == "upsampling":
+
+        results["upsampling"] = benchmark_upsampling()
+
+    elif benchmark == "shared_discriminator_pass":
+
+        # train steps with reals and fakes in separate discriminator calls and in one call
+        results["shared_discriminator_pass"] = dict(
+            separate=benchmark_train(shared_discriminator_pass=False),
+            shared=benchmark_train(shared_discriminator_pass=True)
+        )
+
+if args.filename:
+
+    with open(args.filename, "w") as f:
+        json.dump(results, f, indent=4)
+
+else:
+
+    print(json.dumps(results, indent=4))
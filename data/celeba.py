@@ -4,12 +4,21 @@ from . import dataset
 
 class Dataset(dataset.Dataset):
 
-    def __init__(self, image_size, data_format):
+    def __init__(self, image_size, data_format, num_parallel_reads=None,
+                 num_parallel_calls=None, prefetch_buffer_size=None, cache_directory=None,
+                 cache_shuffle_buffer_size=10000, collect_statistics=False):
 
         self.image_size = image_size
         self.data_format = data_format
 
-        super(Dataset, self).__init__()
+        super(Dataset, self).__init__(
+            num_parallel_reads=num_parallel_reads,
+            num_parallel_calls=num_parallel_calls,
+            prefetch_buffer_size=prefetch_buffer_size,
+            cache_directory=cache_directory,
+            cache_shuffle_buffer_size=cache_shuffle_buffer_size,
+            collect_statistics=collect_statistics
+        )
 
     def parse(self, example):
 
@@ -20,12 +29,52 @@ class Dataset(dataset.Dataset):
                     shape=[],
                     dtype=tf.string,
                     default_value=""
+                ),
+                "image": tf.FixedLenFeature(
+                    shape=[],
+                    dtype=tf.string,
+                    default_value=""
+                ),
+                "height": tf.FixedLenFeature(
+                    shape=[],
+                    dtype=tf.int64,
+                    default_value=0
+                ),
+                "width": tf.FixedLenFeature(
+                    shape=[],
+                    dtype=tf.int64,
+                    default_value=0
                 )
             }
         )
 
-        image = tf.read_file(features["path"])
-        image = tf.image.decode_jpeg(image, 3)
+        # records made with --store_images contain encoded images,
+        # otherwise read images from paths
+        image = tf.cond(
+            pred=tf.equal(features["image"], ""),
+            true_fn=lambda: tf.read_file(features["path"]),
+            false_fn=lambda: features["image"]
+        )
+
+        # records made with --store_shapes contain image shapes,
+        # otherwise extract them from jpeg headers without decoding
+        shape = tf.cond(
+            pred=tf.greater(features["height"], 0),
+            true_fn=lambda: tf.stack([features["height"], features["width"]]),
+            false_fn=lambda: tf.cast(tf.image.extract_jpeg_shape(image)[:2], tf.int64)
+        )
+        shape = tf.cast(shape, tf.int32)
+
+        # decode only the central 128x128 window
+        # that resize_image_with_crop_or_pad keeps
+        crop_size = tf.minimum(shape, 128)
+        crop_offset = (shape - crop_size) // 2
+
+        image = tf.image.decode_and_crop_jpeg(
+            contents=image,
+            crop_window=tf.concat([crop_offset, crop_size], axis=0),
+            channels=3
+        )
         image = tf.image.convert_image_dtype(image, tf.float32)
         image = tf.image.resize_image_with_crop_or_pad(image, 128, 128)
         image = tf.image.resize_images(image, self.image_size)
@@ -35,3 +84,7 @@ class Dataset(dataset.Dataset):
             image = tf.transpose(image, [2, 0, 1])
 
         return image
+
+    def cache_name(self):
+
+        return "celeba_{}x{}_{}".format(self.image_size[0], self.image_size[1], self.data_format)
@@ -1,27 +1,279 @@
 import tensorflow as tf
 import argparse
+import multiprocessing
+import functools
+import hashlib
+import struct
+import json
+import zlib
 import os
 import glob
 
-parser = argparse.ArgumentParser()
-parser.add_argument("--filename", type=str, required=True, help="tfrecord filename")
-parser.add_argument("--directory", type=str, required=True, help="path to data directory")
-args = parser.parse_args()
-
-with tf.python_io.TFRecordWriter(args.filename) as writer:
-
-    for file in glob.glob(os.path.join(args.directory, "*")):
-
-        writer.write(
-            record=tf.train.Example(
-                features=tf.train.Features(
-                    feature={
-                        "path": tf.train.Feature(
-                            bytes_list=tf.train.BytesList(
-                                value=[file.encode("utf-8")]
-                            )
-                        )
-                    }
+
+def shard_filename(filename, index, num_shards):
+
+    return filename if num_shards == 1 else "{}-{:05d}-of-{:05d}".format(filename, index, num_shards)
+
+
+def manifest_filename(filename):
+
+    return "{}.manifest.json".format(filename)
+
+
+def load_manifest(filename):
+
+    if not os.path.exists(manifest_filename(filename)):
+        return None
+
+    with open(manifest_filename(filename)) as f:
+        return json.load(f)
+
+
+def checksum(filename):
+
+    sha256 = hashlib.sha256()
+
+    with open(filename, "rb") as f:
+        for chunk in iter(functools.partial(f.read, 1 << 20), b""):
+            sha256.update(chunk)
+
+    return sha256.hexdigest()
+
+
+def fingerprint(files, options):
+    ''' fingerprint of shard inputs
+
+        changes when files are added, removed or modified,
+        or when the builder options change
+    '''
+
+    sha256 = hashlib.sha256(json.dumps(options, sort_keys=True).encode("utf-8"))
+
+    for file in files:
+        stat = os.stat(file)
+        sha256.update("{}:{}:{}\n".format(file, stat.st_size, stat.st_mtime).encode("utf-8"))
+
+    return sha256.hexdigest()
+
+
+def jpeg_shape(image):
+    ''' height and width in the frame header (SOF marker) of encoded jpeg,
+        read without decoding as tf.image.extract_jpeg_shape does,
+        None if image is not a jpeg or its header is broken
+    '''
+
+    if image[:2] != b"\xff\xd8":
+        return None
+
+    offset = 2
+
+    while offset + 4 <= len(image):
+
+        if image[offset] != 0xff:
+            return None
+
+        marker = image[offset + 1]
+
+        # fill bytes before a marker
+        if marker == 0xff:
+            offset += 1
+            continue
+
+        # markers without segment (TEM, RSTn)
+        if marker == 0x01 or 0xd0 <= marker <= 0xd7:
+            offset += 2
+            continue
+
+        # end of image or start of scan before frame header
+        if marker in [0xd9, 0xda]:
+            return None
+
+        length, = struct.unpack(">H", image[offset + 2:offset + 4])
+
+        # SOFn except DHT (0xc4), JPG (0xc8) and DAC (0xcc)
+        if 0xc0 <= marker <= 0xcf and marker not in [0xc4, 0xc8, 0xcc]:
+
+            if offset + 9 > len(image):
+                return None
+
+            height, width = struct.unpack(">HH", image[offset + 5:offset + 9])
+
+            return (height, width) if height and width else None
+
+        offset += 2 + length
+
+    return None
+
+
+def make_example(file, store_images, store_shapes):
+    ''' tf.train.Example of file, None if store_shapes and file is not a valid jpeg '''
+
+    feature = {
+        "path": tf.train.Feature(
+            bytes_list=tf.train.BytesList(
+                value=[file.encode("utf-8")]
+            )
+        )
+    }
+
+    #========================================================================#
+    # packing encoded images into records turns per-image random reads
+    # into large sequential reads of tfrecord files when training
+    #========================================================================#
+    if store_images:
+
+        with open(file, "rb") as f:
+            image = f.read()
+
+        feature["image"] = tf.train.Feature(
+            bytes_list=tf.train.BytesList(
+                value=[image]
+            )
+        )
+
+        if store_shapes:
+
+            shape = jpeg_shape(image)
+
+            if not shape:
+                return None
+
+            height, width = shape
+
+            feature["height"] = tf.train.Feature(
+                int64_list=tf.train.Int64List(
+                    value=[height]
+                )
+            )
+            feature["width"] = tf.train.Feature(
+                int64_list=tf.train.Int64List(
+                    value=[width]
                 )
-            ).SerializeToString()
+            )
+
+    return tf.train.Example(
+        features=tf.train.Features(
+            feature=feature
         )
+    )
+
+
+def write_shard(filename, files, store_images, store_shapes):
+    ''' returns number of records, checksum of shard and files skipped as invalid '''
+
+    skipped_files = []
+
+    with tf.python_io.TFRecordWriter(filename) as writer:
+
+        for file in files:
+
+            example = make_example(
+                file=file,
+                store_images=store_images,
+                store_shapes=store_shapes
+            )
+
+            if example is None:
+                skipped_files.append(file)
+                continue
+
+            writer.write(record=example.SerializeToString())
+
+    return len(files) - len(skipped_files), checksum(filename), skipped_files
+
+
+def build(filename, directory, num_shards, num_workers, store_images, store_shapes):
+    ''' write files in directory into num_shards tfrecord files in parallel
+
+        files are assigned to shards by hash of their names,
+        so that adding or removing files changes only the shards they belong to.
+        shards whose inputs are unchanged since the last build are skipped.
+    '''
+
+    files = sorted(glob.glob(os.path.join(directory, "*")))
+
+    sharded_files = [[] for _ in range(num_shards)]
+    for file in files:
+        sharded_files[zlib.crc32(os.path.basename(file).encode("utf-8")) % num_shards].append(file)
+
+    options = dict(store_images=store_images, store_shapes=store_shapes)
+
+    manifest = load_manifest(filename) or {}
+    shards = {shard["filename"]: shard for shard in manifest.get("shards", [])}
+
+    shard_filenames = [shard_filename(filename, index, num_shards) for index in range(num_shards)]
+    inputs = [fingerprint(files, options) for files in sharded_files]
+
+    def unchanged(index):
+
+        shard = shards.get(os.path.basename(shard_filenames[index]))
+
+        return (shard is not None and shard["inputs"] == inputs[index] and
+                os.path.exists(shard_filenames[index]) and
+                checksum(shard_filenames[index]) == shard["checksum"])
+
+    indices = [index for index in range(num_shards) if not unchanged(index)]
+
+    print("{} of {} shards unchanged".format(num_shards - len(indices), num_shards))
+
+    pool = multiprocessing.Pool(num_workers)
+
+    try:
+        results = pool.starmap(write_shard, [
+            (shard_filenames[index], sharded_files[index], store_images, store_shapes)
+            for index in indices
+        ])
+
+    finally:
+        pool.close()
+        pool.join()
+
+    for index, (num_records, shard_checksum, skipped_files) in zip(indices, results):
+
+        for file in skipped_files:
+            print("{} skipped (not a valid jpeg)".format(file))
+
+        shards[os.path.basename(shard_filenames[index])] = dict(
+            filename=os.path.basename(shard_filenames[index]),
+            num_records=num_records,
+            checksum=shard_checksum,
+            inputs=inputs[index]
+        )
+
+        print("{} written ({} records)".format(shard_filenames[index], num_records))
+
+    manifest = dict(
+        directory=directory,
+        options=options,
+        num_records=sum(shards[os.path.basename(shard_filename)]["num_records"] for shard_filename in shard_filenames),
+        shards=[shards[os.path.basename(shard_filename)] for shard_filename in shard_filenames]
+    )
+
+    with open(manifest_filename(filename), "w") as f:
+        json.dump(manifest, f, indent=4)
+
+    return shard_filenames
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--filename", type=str, required=True, help="tfrecord filename")
+    parser.add_argument("--directory", type=str, required=True, help="path to data directory")
+    parser.add_argument("--num_shards", type=int, default=1, help="number of tfrecord files to write")
+    parser.add_argument("--num_workers", type=int, default=multiprocessing.cpu_count(), help="number of processes to write shards")
+    parser.add_argument("--store_images", action="store_true", help="store encoded image bytes instead of reading files when training")
+    parser.add_argument("--store_shapes", action="store_true", help="store image height and width (requires --store_images)")
+    args = parser.parse_args()
+
+    if args.store_shapes and not args.store_images:
+        parser.error("--store_shapes requires --store_images")
+
+    build(
+        filename=args.filename,
+        directory=args.directory,
+        num_shards=args.num_shards,
+        num_workers=args.num_workers,
+        store_images=args.store_images,
+        store_shapes=args.store_shapes
+    )
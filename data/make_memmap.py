@@ -0,0 +1,64 @@
+#=================================================================================================#
+# convert tfrecord files into a memory-mapped .npy file of pre-resized uint8 images
+# usage: python -m data.make_memmap --filename celeba_64x64.npy --filenames celeba.tfrecord*
+#=================================================================================================#
+
+import tensorflow as tf
+import numpy as np
+import argparse
+from . import celeba
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--filename", type=str, required=True, help="npy filename")
+parser.add_argument("--filenames", type=str, nargs="+", required=True, help="tfrecord filenames")
+parser.add_argument("--image_size", type=int, nargs=2, default=[64, 64], help="image size")
+parser.add_argument("--data_format", type=str, choices=["channels_first", "channels_last"], default="channels_last", help="data_format")
+parser.add_argument("--batch_size", type=int, default=1000, help="batch size")
+parser.add_argument("--num_parallel_calls", type=int, default=None, help="number of records to parse in parallel")
+args = parser.parse_args()
+
+num_records = sum(
+    1 for filename in args.filenames
+    for _ in tf.python_io.tf_record_iterator(filename)
+)
+
+dataset = celeba.Dataset(
+    image_size=args.image_size,
+    data_format=args.data_format,
+    num_parallel_calls=args.num_parallel_calls
+)
+
+images = tf.image.convert_image_dtype(dataset.get_next(), tf.uint8, saturate=True)
+
+memmap = np.lib.format.open_memmap(
+    filename=args.filename,
+    mode="w+",
+    dtype=np.uint8,
+    shape=tuple([num_records] + images.shape.as_list()[1:])
+)
+
+with tf.Session() as session:
+
+    dataset.initialize(
+        filenames=args.filenames,
+        num_epochs=1,
+        batch_size=args.batch_size,
+        buffer_size=1
+    )
+
+    offset = 0
+
+    while True:
+
+        try:
+            batch = session.run(images)
+
+        except tf.errors.OutOfRangeError:
+            break
+
+        memmap[offset:offset + len(batch)] = batch
+        offset += len(batch)
+
+        print("{}/{} images written".format(offset, num_records))
+
+memmap.flush()
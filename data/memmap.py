@@ -0,0 +1,77 @@
+import tensorflow as tf
+import numpy as np
+from . import dataset
+
+
+class Dataset(dataset.Dataset):
+    ''' input pipeline over pre-resized uint8 images in a single .npy file
+
+        images are read from a memory-mapped array by index,
+        indices are permuted every epoch instead of using a shuffle buffer,
+        which gives global shuffling without filling a buffer at startup.
+        make the .npy file with make_memmap.py
+    '''
+
+    def __init__(self, image_size, data_format, num_parallel_calls=None, prefetch_buffer_size=None,
+                 collect_statistics=False):
+
+        self.image_size = image_size
+        self.data_format = data_format
+        self.image_shape = [3] + image_size if data_format == "channels_first" else image_size + [3]
+
+        self.images = None
+        self.num_records = tf.placeholder(dtype=tf.int64, shape=[])
+
+        super(Dataset, self).__init__(
+            num_parallel_calls=num_parallel_calls,
+            prefetch_buffer_size=prefetch_buffer_size,
+            collect_statistics=collect_statistics
+        )
+
+    def build(self):
+
+        dataset = tf.data.Dataset.range(self.num_epochs)
+        dataset = dataset.flat_map(
+            lambda epoch: tf.data.Dataset.from_tensor_slices(tf.random_shuffle(tf.range(self.num_records)))
+        )
+        dataset = dataset.batch(self.batch_size)
+        dataset = dataset.map(
+            map_func=self.gather,
+            num_parallel_calls=self.num_parallel_calls
+        )
+
+        return dataset
+
+    def gather(self, indices):
+
+        # sorted indices make reads from memory-mapped file more sequential
+        images = tf.py_func(
+            func=lambda indices: self.images[np.sort(indices)],
+            inp=[indices],
+            Tout=tf.uint8,
+            stateful=False
+        )
+        images.set_shape([None] + self.image_shape)
+
+        return tf.image.convert_image_dtype(images, tf.float32)
+
+    def initialize(self, filenames, num_epochs, batch_size, buffer_size=None):
+
+        session = tf.get_default_session()
+
+        if len(filenames) != 1:
+            raise ValueError("Memory-mapped dataset must be a single file")
+
+        self.images = np.load(filenames[0], mmap_mode="r")
+
+        if list(self.images.shape[1:]) != self.image_shape or self.images.dtype != np.uint8:
+            raise ValueError("Invalid memory-mapped dataset: {}".format(filenames[0]))
+
+        session.run(
+            self.iterator.initializer,
+            feed_dict={
+                self.num_records: len(self.images),
+                self.num_epochs: num_epochs,
+                self.batch_size: batch_size
+            }
+        )
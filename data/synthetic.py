@@ -0,0 +1,31 @@
+import tensorflow as tf
+from . import dataset
+
+
+class Dataset(dataset.Dataset):
+    ''' synthetic images for benchmarking
+
+        yields the same random batch num_epochs times, at no input cost.
+        filenames and buffer_size are ignored
+    '''
+
+    def __init__(self, image_size, data_format, prefetch_buffer_size=None):
+
+        self.image_size = image_size
+        self.data_format = data_format
+        self.image_shape = [3] + image_size if data_format == "channels_first" else image_size + [3]
+
+        super(Dataset, self).__init__(
+            prefetch_buffer_size=prefetch_buffer_size
+        )
+
+    def build(self):
+
+        # batch_size placeholder is int64, shape must be of one dtype
+        images = tf.random_uniform(shape=tf.concat([[tf.cast(self.batch_size, tf.int32)], self.image_shape], axis=0))
+        images.set_shape([None] + self.image_shape)
+
+        dataset = tf.data.Dataset.from_tensors(images)
+        dataset = dataset.repeat(self.num_epochs)
+
+        return dataset
@@ -0,0 +1,105 @@
+#=================================================================================================#
+# evaluate trained generator with FID and KID
+#
+# python evaluate.py --model_dir celeba_dcgan_model --filenames celeba.tfrecord --num_images 50000
+#
+# features are extracted by a frozen graph given by --feature_extractor (e.g. Inception v3 pool_3),
+# or by a bundled convnet with fixed random weights if not given
+#=================================================================================================#
+
+import tensorflow as tf
+import argparse
+import json
+from models import sampler, evaluation
+from networks import dcgan, resnet
+from data import celeba
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--model_dir", type=str, default="celeba_dcgan_model", help="model directory")
+parser.add_argument('--filenames', type=str, nargs="+", default=["celeba.tfrecord"], help="tfrecord filenames of real images")
+parser.add_argument("--architecture", type=str, choices=["dcgan", "resnet"], default="dcgan", help="generator architecture")
+parser.add_argument("--resolution", type=int, default=64, help="image resolution")
+parser.add_argument("--min_filters", type=int, default=32, help="number of filters at max resolution")
+parser.add_argument("--max_filters", type=int, default=512, help="number of filters at min resolution")
+parser.add_argument("--latent_size", type=int, default=128, help="latent size")
+parser.add_argument('--data_format', type=str, choices=["channels_first", "channels_last"], default="channels_last", help="data_format")
+parser.add_argument("--num_images", type=int, default=50000, help="number of real and fake images")
+parser.add_argument("--batch_size", type=int, default=500, help="batch size")
+parser.add_argument("--seed", type=int, default=0, help="random seed of latents and KID subsets")
+parser.add_argument("--feature_extractor", type=str, default=None, help="frozen graph filename of feature extractor (bundled random convnet if not given)")
+parser.add_argument("--input_name", type=str, default="ExpandDims:0", help="input tensor name of feature extractor")
+parser.add_argument("--output_name", type=str, default="pool_3:0", help="output tensor name of feature extractor")
+parser.add_argument("--input_size", type=int, default=299, help="input image size of feature extractor")
+parser.add_argument("--cache_directory", type=str, default="evaluation_cache", help="directory to cache statistics of real images")
+parser.add_argument("--reservoir_size", type=int, default=10000, help="number of features kept for KID")
+parser.add_argument("--num_subsets", type=int, default=100, help="number of subsets for KID")
+parser.add_argument("--subset_size", type=int, default=1000, help="subset size for KID")
+parser.add_argument("--ema", action="store_true", help="use exponential moving averages of generator variables")
+parser.add_argument('--gpu', type=str, default="0", help="gpu id")
+args = parser.parse_args()
+
+tf.logging.set_verbosity(tf.logging.INFO)
+
+networks = dict(dcgan=dcgan, resnet=resnet)
+
+gan_sampler = sampler.Sampler(
+    generator=networks[args.architecture].Generator(
+        min_resolution=4,
+        max_resolution=args.resolution,
+        min_filters=args.min_filters,
+        max_filters=args.max_filters,
+        data_format=args.data_format
+    ),
+    latent_size=args.latent_size,
+    data_format=args.data_format,
+    name=args.model_dir
+)
+
+if args.feature_extractor:
+
+    feature_extractor = evaluation.GraphDefFeatureExtractor(
+        filename=args.feature_extractor,
+        input_name=args.input_name,
+        output_name=args.output_name,
+        image_size=[args.input_size, args.input_size]
+    )
+
+else:
+
+    feature_extractor = evaluation.RandomFeatureExtractor()
+
+evaluator = evaluation.Evaluator(
+    sampler=gan_sampler,
+    dataset=celeba.Dataset(
+        image_size=[args.resolution, args.resolution],
+        data_format=args.data_format
+    ),
+    extractor=feature_extractor,
+    data_format=args.data_format,
+    cache_directory=args.cache_directory,
+    reservoir_size=args.reservoir_size
+)
+
+config = tf.ConfigProto(
+    gpu_options=tf.GPUOptions(
+        visible_device_list=args.gpu,
+        allow_growth=True
+    ),
+    log_device_placement=False,
+    allow_soft_placement=True
+)
+
+with tf.Session(config=config) as session:
+
+    gan_sampler.restore(ema=args.ema)
+
+    scores = evaluator.evaluate(
+        filenames=args.filenames,
+        num_images=args.num_images,
+        batch_size=args.batch_size,
+        seed=args.seed,
+        num_subsets=args.num_subsets,
+        subset_size=args.subset_size
+    )
+
+    print(json.dumps(scores, indent=4))
@@ -0,0 +1,59 @@
+#=================================================================================================#
+# export frozen generator graph for serving
+#
+# python export.py --model_dir celeba_dcgan_model --filename generator.pb
+#=================================================================================================#
+
+import tensorflow as tf
+import argparse
+from models import sampler, export
+from networks import dcgan, resnet
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--model_dir", type=str, default="celeba_dcgan_model", help="model directory")
+parser.add_argument("--architecture", type=str, choices=["dcgan", "resnet"], default="dcgan", help="generator architecture")
+parser.add_argument("--resolution", type=int, default=64, help="image resolution")
+parser.add_argument("--min_filters", type=int, default=32, help="number of filters at max resolution")
+parser.add_argument("--max_filters", type=int, default=512, help="number of filters at min resolution")
+parser.add_argument("--latent_size", type=int, default=128, help="latent size")
+parser.add_argument('--data_format', type=str, choices=["channels_first", "channels_last"], default="channels_last", help="data_format")
+parser.add_argument("--filename", type=str, default="generator.pb", help="frozen graph filename")
+parser.add_argument("--as_text", action="store_true", help="write graph in text format")
+parser.add_argument("--ema", action="store_true", help="use exponential moving averages of generator variables")
+parser.add_argument("--discriminator_logits", action="store_true", help="also export discriminator logits of fakes from cached normalized kernels (model trained with --cache_spectral_normalization)")
+args = parser.parse_args()
+
+tf.logging.set_verbosity(tf.logging.INFO)
+
+networks = dict(dcgan=dcgan, resnet=resnet)
+
+gan_sampler = sampler.Sampler(
+    generator=networks[args.architecture].Generator(
+        min_resolution=4,
+        max_resolution=args.resolution,
+        min_filters=args.min_filters,
+        max_filters=args.max_filters,
+        data_format=args.data_format
+    ),
+    latent_size=args.latent_size,
+    data_format=args.data_format,
+    name=args.model_dir,
+    discriminator=networks[args.architecture].Discriminator(
+        min_resolution=4,
+        max_resolution=args.resolution,
+        min_filters=args.min_filters,
+        max_filters=args.max_filters,
+        data_format=args.data_format,
+        cache_spectral_normalization=True
+    ) if args.discriminator_logits else None
+)
+
+with tf.Session() as session:
+
+    gan_sampler.restore(ema=args.ema)
+
+    export.export(
+        sampler=gan_sampler,
+        filename=args.filename,
+        as_text=args.as_text
+    )
@@ -15,7 +15,7 @@ import tensorflow as tf
 import argparse
 from models import gan
 from networks import dcgan, resnet
-from data import celeba
+from data import celeba, memmap
 from utils import attr_dict
 
 parser = argparse.ArgumentParser()
@@ -24,19 +24,65 @@ parser.add_argument('--filenames', type=str, nargs="+", default=["celeba.tfrecor
 parser.add_argument("--num_epochs", type=int, default=100, help="number of training epochs")
 parser.add_argument("--batch_size", type=int, default=64, help="batch size")
 parser.add_argument("--buffer_size", type=int, default=100000, help="buffer size to shuffle dataset")
+parser.add_argument("--num_parallel_reads", type=int, default=None, help="number of tfrecord files to read in parallel")
+parser.add_argument("--num_parallel_calls", type=int, default=None, help="number of records to parse in parallel")
+parser.add_argument("--prefetch_buffer_size", type=int, default=None, help="number of batches to prefetch (autotuned if not specified)")
+parser.add_argument("--cache_directory", type=str, default=None, help="directory to cache decoded and resized images")
+parser.add_argument("--cache_shuffle_buffer_size", type=int, default=10000, help="max shuffle buffer size of decoded images when cached (48 KB per 128x128 image)")
+parser.add_argument("--collect_input_statistics", action="store_true", help="record input pipeline latencies and prefetch buffer utilization in summaries (always on with --profile_steps)")
+parser.add_argument("--memmap_filenames", type=str, nargs=2, default=None, help="npy filenames for 64x64 and 128x128 models made by data/make_memmap.py (used instead of tfrecord files)")
 parser.add_argument('--data_format', type=str, choices=["channels_first", "channels_last"], default="channels_last", help="data_format")
+parser.add_argument("--shared_discriminator_pass", action="store_true", help="run discriminator once over concatenated reals and fakes")
+parser.add_argument("--gradient_penalty_interval", type=int, default=1, help="evaluate gradient penalty every this number of steps")
+parser.add_argument("--gradient_penalty_fraction", type=float, default=1.0, help="fraction of batch to evaluate gradient penalty on")
+parser.add_argument("--num_discriminator_steps", type=int, default=1, help="number of discriminator steps per iteration")
+parser.add_argument("--num_generator_steps", type=int, default=1, help="number of generator steps per iteration")
+parser.add_argument("--devices", type=str, nargs="+", default=None, help="devices to split batch across (e.g. /gpu:0 /gpu:1 or /cpu:0 /cpu:1)")
+parser.add_argument("--num_cpus", type=int, default=1, help="number of cpu devices (to train on multiple cpu devices)")
+parser.add_argument("--batch_norm_updates", type=str, choices=["all_towers", "first_tower"], default="all_towers", help="towers to update batch norm moving statistics")
+parser.add_argument("--ema_decay", type=float, default=None, help="decay of exponential moving averages of generator variables (e.g. 0.999)")
+parser.add_argument("--power_iteration_rounds", type=int, default=1, help="number of power iteration rounds for spectral normalization")
+parser.add_argument("--cache_spectral_normalization", action="store_true", help="keep spectrally normalized kernels in variables refreshed every training step")
+parser.add_argument("--compute_dtype", type=str, choices=["float32", "float16"], default="float32", help="dtype of activations and kernels in networks")
+parser.add_argument("--checkpoint_steps", type=int, default=100000, help="save checkpoint every this number of steps")
+parser.add_argument("--checkpoint_secs", type=int, default=None, help="save checkpoint every this number of seconds")
+parser.add_argument("--max_to_keep", type=int, default=5, help="number of recent checkpoints to keep")
+parser.add_argument("--keep_checkpoint_every_n_hours", type=float, default=10000.0, help="keep one checkpoint every this number of hours in addition to recent ones")
+parser.add_argument("--profile_steps", type=int, default=None, help="profile training and trace a step every this number of steps")
 parser.add_argument('--train', action="store_true", help="training mode")
 parser.add_argument('--gpu', type=str, default="0", help="gpu id")
 args = parser.parse_args()
 
 tf.logging.set_verbosity(tf.logging.INFO)
 
+
+def make_dataset(image_size):
+
+    if args.memmap_filenames:
+
+        return memmap.Dataset(
+            image_size=image_size,
+            data_format=args.data_format,
+            num_parallel_calls=args.num_parallel_calls,
+            prefetch_buffer_size=args.prefetch_buffer_size,
+            collect_statistics=args.collect_input_statistics or bool(args.profile_steps)
+        )
+
+    return celeba.Dataset(
+        image_size=image_size,
+        data_format=args.data_format,
+        num_parallel_reads=args.num_parallel_reads,
+        num_parallel_calls=args.num_parallel_calls,
+        prefetch_buffer_size=args.prefetch_buffer_size,
+        cache_directory=args.cache_directory,
+        cache_shuffle_buffer_size=args.cache_shuffle_buffer_size,
+        collect_statistics=args.collect_input_statistics or bool(args.profile_steps)
+    )
+
+
 gan_models = [
     gan.Model(
-        dataset=celeba.Dataset(
-            image_size=[64, 64],
-            data_format=args.data_format
-        ),
+        dataset=make_dataset(image_size=[64, 64]),
         generator=dcgan.Generator(
             min_resolution=4,
             max_resolution=64,
@@ -49,24 +95,35 @@ gan_models = [
             max_resolution=64,
             min_filters=32,
             max_filters=512,
-            data_format=args.data_format
+            data_format=args.data_format,
+            power_iteration_rounds=args.power_iteration_rounds,
+            cache_spectral_normalization=args.cache_spectral_normalization
         ),
         loss_function=gan.Model.LossFunction.NS_GAN,
         gradient_penalty=gan.Model.GradientPenalty.ONE_CENTERED,
         hyper_params=attr_dict.AttrDict(
             latent_size=128,
             gradient_coefficient=1.0,
+            gradient_penalty_interval=args.gradient_penalty_interval,
+            gradient_penalty_fraction=args.gradient_penalty_fraction,
+            num_discriminator_steps=args.num_discriminator_steps,
+            num_generator_steps=args.num_generator_steps,
+            ema_decay=args.ema_decay,
             learning_rate=0.0002,
             beta1=0.5,
             beta2=0.999
         ),
+        shared_discriminator_pass=args.shared_discriminator_pass,
+        devices=args.devices,
+        batch_norm_updates=dict(
+            all_towers=gan.Model.BatchNormUpdates.ALL_TOWERS,
+            first_tower=gan.Model.BatchNormUpdates.FIRST_TOWER
+        )[args.batch_norm_updates],
+        compute_dtype=tf.as_dtype(args.compute_dtype),
         name=args.model_dir
     ),
     gan.Model(
-        dataset=celeba.Dataset(
-            image_size=[128, 128],
-            data_format=args.data_format
-        ),
+        dataset=make_dataset(image_size=[128, 128]),
         generator=dcgan.Generator(
             min_resolution=4,
             max_resolution=128,
@@ -79,17 +136,31 @@ gan_models = [
             max_resolution=128,
             min_filters=16,
             max_filters=512,
-            data_format=args.data_format
+            data_format=args.data_format,
+            power_iteration_rounds=args.power_iteration_rounds,
+            cache_spectral_normalization=args.cache_spectral_normalization
         ),
         loss_function=gan.Model.LossFunction.NS_GAN,
         gradient_penalty=gan.Model.GradientPenalty.ONE_CENTERED,
         hyper_params=attr_dict.AttrDict(
             latent_size=128,
             gradient_coefficient=1.0,
+            gradient_penalty_interval=args.gradient_penalty_interval,
+            gradient_penalty_fraction=args.gradient_penalty_fraction,
+            num_discriminator_steps=args.num_discriminator_steps,
+            num_generator_steps=args.num_generator_steps,
+            ema_decay=args.ema_decay,
             learning_rate=0.0002,
             beta1=0.5,
             beta2=0.999
         ),
+        shared_discriminator_pass=args.shared_discriminator_pass,
+        devices=args.devices,
+        batch_norm_updates=dict(
+            all_towers=gan.Model.BatchNormUpdates.ALL_TOWERS,
+            first_tower=gan.Model.BatchNormUpdates.FIRST_TOWER
+        )[args.batch_norm_updates],
+        compute_dtype=tf.as_dtype(args.compute_dtype),
         name=args.model_dir,
         reuse=tf.AUTO_REUSE
     ),
@@ -100,34 +171,50 @@ config = tf.ConfigProto(
         visible_device_list=args.gpu,
         allow_growth=True
     ),
+    device_count=dict(CPU=args.num_cpus),
     log_device_placement=False,
     allow_soft_placement=True
 )
 
+if args.memmap_filenames:
+    gan_model_filenames = [[filename] for filename in args.memmap_filenames]
+else:
+    gan_model_filenames = [args.filenames] * len(gan_models)
+
 with tf.Session(config=config) as session:
 
-    for gan_model in gan_models[:1]:
+    for gan_model, filenames in zip(gan_models[:1], gan_model_filenames[:1]):
 
         gan_model.initialize()
         
         if args.train:
 
             gan_model.train(
-                filenames=args.filenames,
+                filenames=filenames,
                 num_epochs=args.num_epochs,
                 batch_size=args.batch_size,
-                buffer_size=args.buffer_size
+                buffer_size=args.buffer_size,
+                checkpoint_steps=args.checkpoint_steps,
+                checkpoint_secs=args.checkpoint_secs,
+                max_to_keep=args.max_to_keep,
+                keep_checkpoint_every_n_hours=args.keep_checkpoint_every_n_hours,
+                profile_steps=args.profile_steps
             )
         
-    for gan_model in gan_models[1:]:
+    for gan_model, filenames in zip(gan_models[1:], gan_model_filenames[1:]):
 
         gan_model.reinitialize()
 
         if args.train:
 
             gan_model.train(
-                filenames=args.filenames,
+                filenames=filenames,
                 num_epochs=args.num_epochs,
                 batch_size=args.batch_size,
-                buffer_size=args.buffer_size
+                buffer_size=args.buffer_size,
+                checkpoint_steps=args.checkpoint_steps,
+                checkpoint_secs=args.checkpoint_secs,
+                max_to_keep=args.max_to_keep,
+                keep_checkpoint_every_n_hours=args.keep_checkpoint_every_n_hours,
+                profile_steps=args.profile_steps
             )
@@ -0,0 +1,149 @@
+import tensorflow as tf
+import os
+import time
+from concurrent import futures
+
+
+class CheckpointWriter(object):
+    ''' checkpoint writer that does not block training
+
+        variables are copied to host memory on the training thread (a single session.run),
+        then loaded into a mirror graph on cpu and saved there on a background thread,
+        so that training continues while the checkpoint is serialized.
+        at most one checkpoint is being written at a time.
+        checkpoints have the same variable names as the training graph,
+        so they are restored by the model's own saver.
+        checkpoints already in directory count towards max_to_keep,
+        so that older ones are deleted as training continues after a restart.
+
+        host memory: while a checkpoint is written, the snapshot (numpy arrays)
+        and the mirror variables both hold a copy of every variable,
+        i.e. about twice the size of the checkpoint (including optimizer slots) on top of training
+    '''
+
+    def __init__(self, session, variables, directory, global_step=0, filename="model.ckpt",
+                 save_steps=None, save_secs=None, max_to_keep=5, keep_checkpoint_every_n_hours=10000.0):
+
+        self.session = session
+        self.variables = variables
+        self.save_path = os.path.join(directory, filename)
+        self.save_steps = save_steps
+        self.save_secs = save_secs
+
+        # graph is written only once, it doesn't change while training
+        tf.train.write_graph(
+            graph_or_graph_def=session.graph.as_graph_def(),
+            logdir=directory,
+            name="graph.pb",
+            as_text=False
+        )
+
+        self.graph = tf.Graph()
+
+        with self.graph.as_default():
+
+            # mirror variables are initialized from placeholders fed with the snapshot
+            self.placeholders = [
+                tf.placeholder(
+                    dtype=variable.dtype.base_dtype,
+                    shape=variable.shape
+                ) for variable in self.variables
+            ]
+
+            mirror_variables = [
+                tf.Variable(
+                    initial_value=placeholder,
+                    trainable=False,
+                    name=variable.op.name
+                ) for variable, placeholder in zip(self.variables, self.placeholders)
+            ]
+
+            self.initializer = tf.variables_initializer(mirror_variables)
+
+            self.saver = tf.train.Saver(
+                var_list={
+                    variable.op.name: mirror_variable
+                    for variable, mirror_variable in zip(self.variables, mirror_variables)
+                },
+                max_to_keep=max_to_keep,
+                keep_checkpoint_every_n_hours=keep_checkpoint_every_n_hours
+            )
+
+        # the saver only tracks checkpoints it has written itself
+        checkpoint_state = tf.train.get_checkpoint_state(directory)
+
+        if checkpoint_state:
+            self.saver.recover_last_checkpoints(checkpoint_state.all_model_checkpoint_paths)
+
+        self.mirror_session = tf.Session(
+            graph=self.graph,
+            config=tf.ConfigProto(device_count=dict(GPU=0))
+        )
+
+        self.executor = futures.ThreadPoolExecutor(1)
+        self.future = None
+
+        self.last_step = global_step
+        self.last_time = time.time()
+
+    def maybe_save(self, global_step):
+        ''' save if step interval or time interval has passed since the last save '''
+
+        if self.save_steps and global_step // self.save_steps > self.last_step // self.save_steps:
+            return self.save(global_step)
+
+        if self.save_secs and time.time() - self.last_time >= self.save_secs:
+            return self.save(global_step)
+
+    def save_if_new(self, global_step):
+        ''' save unless global_step is the step saved last (or restored) '''
+
+        if global_step != self.last_step:
+            return self.save(global_step)
+
+    def save(self, global_step):
+        ''' snapshot variables now and write them in background '''
+
+        # wait for the previous checkpoint, which also keeps only one snapshot in memory
+        self.wait()
+
+        values = self.session.run(self.variables)
+
+        self.last_step = global_step
+        self.last_time = time.time()
+
+        self.future = self.executor.submit(self.write, values, global_step)
+
+    def write(self, values, global_step):
+
+        start = time.time()
+
+        self.mirror_session.run(
+            self.initializer,
+            feed_dict=dict(zip(self.placeholders, values))
+        )
+
+        checkpoint = self.saver.save(
+            sess=self.mirror_session,
+            save_path=self.save_path,
+            global_step=global_step,
+            write_meta_graph=False
+        )
+
+        stop = time.time()
+        print("{} saved ({:.2f} sec)".format(checkpoint, stop - start))
+
+        return checkpoint
+
+    def wait(self):
+        ''' wait for the checkpoint being written, and raise its error if any '''
+
+        if self.future:
+            self.future.result()
+            self.future = None
+
+    def close(self):
+
+        self.wait()
+        self.executor.shutdown()
+        self.mirror_session.close()
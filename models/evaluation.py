@@ -0,0 +1,385 @@
+import tensorflow as tf
+import numpy as np
+import os
+
+
+class RandomFeatureExtractor(object):
+    ''' small convnet with fixed random weights drawn from `seed`
+
+        bundled so that evaluation works offline without any weights file.
+        scores are not comparable with published FID,
+        but are comparable between runs evaluated with the same extractor
+    '''
+
+    def __init__(self, filters=[32, 64, 128, 256], image_size=[64, 64], seed=0):
+
+        self.image_size = image_size
+        self.feature_size = filters[-1]
+        self.name = "random_convnet_{}_{}".format("-".join(map(str, filters)), seed)
+
+        random_state = np.random.RandomState(seed)
+
+        self.kernels = []
+        in_filters = 3
+
+        for out_filters in filters:
+
+            # He initialization, so that activations neither vanish nor explode
+            self.kernels.append((random_state.randn(3, 3, in_filters, out_filters) *
+                                 np.sqrt(2.0 / (3 * 3 * in_filters))).astype(np.float32))
+            in_filters = out_filters
+
+    def __call__(self, images):
+        ''' images: float32 NHWC RGB in [0, 1], returns [batch_size, feature_size] features '''
+
+        inputs = tf.image.resize_bilinear(images, self.image_size)
+        inputs = tf.clip_by_value(inputs, 0.0, 1.0) * 2.0 - 1.0
+
+        for kernel in self.kernels:
+
+            inputs = tf.nn.conv2d(
+                input=inputs,
+                filter=tf.constant(kernel),
+                strides=[1, 2, 2, 1],
+                padding="SAME"
+            )
+
+            inputs = tf.nn.leaky_relu(inputs)
+
+        return tf.reduce_mean(inputs, axis=[1, 2])
+
+
+class GraphDefFeatureExtractor(object):
+    ''' feature extractor from a frozen GraphDef on disk
+        (e.g. pool_3 of Inception v3 for standard FID)
+
+        the graph must accept a batch of NHWC RGB images
+        of image_size with values in input_range at input_name
+    '''
+
+    def __init__(self, filename, input_name, output_name, image_size=[299, 299], input_range=[0.0, 255.0]):
+
+        self.input_name = input_name
+        self.output_name = output_name
+        self.image_size = image_size
+        self.input_range = input_range
+        self.name = "{}_{}".format(
+            os.path.splitext(os.path.basename(filename))[0],
+            output_name.replace("/", "_").replace(":", "_")
+        )
+
+        self.graph_def = tf.GraphDef()
+
+        with tf.gfile.GFile(filename, "rb") as file:
+            self.graph_def.ParseFromString(file.read())
+
+    def __call__(self, images):
+        ''' images: float32 NHWC RGB in [0, 1], returns [batch_size, feature_size] features '''
+
+        inputs = tf.image.resize_bilinear(images, self.image_size)
+        inputs = tf.clip_by_value(inputs, 0.0, 1.0)
+
+        minval, maxval = self.input_range
+        inputs = inputs * (maxval - minval) + minval
+
+        features, = tf.import_graph_def(
+            graph_def=self.graph_def,
+            input_map={self.input_name: inputs},
+            return_elements=[self.output_name],
+            name="feature_extractor"
+        )
+
+        return tf.reshape(features, [tf.shape(features)[0], -1])
+
+
+class FeatureStatistics(object):
+    ''' streaming mean and covariance of features in float64
+
+        batches are merged into running mean and sum of squared deviations
+        (Chan et al., "Updating Formulae and a Pairwise Algorithm for Computing Sample Variances"),
+        so memory doesn't grow with number of samples.
+        a bounded reservoir of features is also kept for KID
+    '''
+
+    def __init__(self, feature_size, reservoir_size=10000, seed=0):
+
+        self.count = 0
+        self.mean = np.zeros([feature_size], dtype=np.float64)
+        self.squared_deviations = np.zeros([feature_size, feature_size], dtype=np.float64)
+        self.reservoir = np.empty([reservoir_size, feature_size], dtype=np.float32)
+        self.random_state = np.random.RandomState(seed)
+
+    def update(self, features):
+
+        batch_size = len(features)
+
+        if not batch_size:
+            return
+
+        #========================================================================#
+        # reservoir sampling (algorithm R),
+        # every feature seen so far is in the reservoir with the same probability
+        #========================================================================#
+        for index, feature in enumerate(features, self.count):
+
+            if index < len(self.reservoir):
+
+                self.reservoir[index] = feature
+
+            else:
+
+                replaced = self.random_state.randint(index + 1)
+
+                if replaced < len(self.reservoir):
+                    self.reservoir[replaced] = feature
+
+        features = features.astype(np.float64)
+
+        batch_mean = np.mean(features, axis=0)
+        batch_deviations = features - batch_mean
+
+        delta = batch_mean - self.mean
+        count = self.count + batch_size
+
+        self.mean += delta * batch_size / count
+        self.squared_deviations += (np.dot(batch_deviations.T, batch_deviations) +
+                                    np.outer(delta, delta) * self.count * batch_size / count)
+        self.count = count
+
+    @property
+    def covariance(self):
+
+        return self.squared_deviations / max(self.count - 1, 1)
+
+    @property
+    def samples(self):
+
+        return self.reservoir[:min(self.count, len(self.reservoir))]
+
+    def save(self, filename):
+
+        np.savez(
+            filename,
+            count=self.count,
+            mean=self.mean,
+            squared_deviations=self.squared_deviations,
+            reservoir=self.samples
+        )
+
+    @staticmethod
+    def load(filename):
+
+        arrays = np.load(filename)
+
+        statistics = FeatureStatistics(
+            feature_size=len(arrays["mean"]),
+            reservoir_size=len(arrays["reservoir"])
+        )
+        statistics.count = int(arrays["count"])
+        statistics.mean = arrays["mean"]
+        statistics.squared_deviations = arrays["squared_deviations"]
+        statistics.reservoir = arrays["reservoir"]
+
+        return statistics
+
+
+def trace_sqrt_product(a, b):
+    ''' trace of sqrt(a b) for symmetric positive semi-definite a and b
+
+        sqrt(a b) is similar to sqrt(sqrt(a) b sqrt(a)), which is symmetric,
+        so only symmetric eigendecompositions are needed (no scipy.linalg.sqrtm)
+    '''
+
+    eigenvalues, eigenvectors = np.linalg.eigh(a)
+    sqrt_a = np.dot(eigenvectors * np.sqrt(np.maximum(eigenvalues, 0.0)), eigenvectors.T)
+
+    eigenvalues = np.linalg.eigvalsh(np.dot(np.dot(sqrt_a, b), sqrt_a))
+
+    return np.sum(np.sqrt(np.maximum(eigenvalues, 0.0)))
+
+
+def frechet_distance(real_statistics, fake_statistics):
+    ''' [GANs Trained by a Two Time-Scale Update Rule Converge to a Local Nash Equilibrium]
+        (https://arxiv.org/pdf/1706.08500.pdf)
+    '''
+
+    delta = real_statistics.mean - fake_statistics.mean
+
+    return (np.dot(delta, delta) +
+            np.trace(real_statistics.covariance) +
+            np.trace(fake_statistics.covariance) -
+            trace_sqrt_product(real_statistics.covariance, fake_statistics.covariance) * 2.0)
+
+
+def kernel_distance(real_features, fake_features, num_subsets=100, subset_size=1000, seed=0):
+    ''' [Demystifying MMD GANs]
+        (https://arxiv.org/pdf/1801.01401.pdf)
+
+        unbiased MMD^2 with cubic polynomial kernel averaged over random subsets,
+        returns mean and standard deviation over subsets
+    '''
+
+    random_state = np.random.RandomState(seed)
+
+    real_features = real_features.astype(np.float64)
+    fake_features = fake_features.astype(np.float64)
+
+    feature_size = real_features.shape[1]
+    subset_size = min(subset_size, len(real_features), len(fake_features))
+
+    def kernel(x, y):
+        return (np.dot(x, y.T) / feature_size + 1.0) ** 3
+
+    distances = []
+
+    for _ in range(num_subsets):
+
+        x = real_features[random_state.choice(len(real_features), subset_size, replace=False)]
+        y = fake_features[random_state.choice(len(fake_features), subset_size, replace=False)]
+
+        kxx = kernel(x, x)
+        kyy = kernel(y, y)
+        kxy = kernel(x, y)
+
+        distances.append(
+            (np.sum(kxx) - np.trace(kxx)) / (subset_size * (subset_size - 1)) +
+            (np.sum(kyy) - np.trace(kyy)) / (subset_size * (subset_size - 1)) -
+            np.mean(kxy) * 2.0
+        )
+
+    return np.mean(distances), np.std(distances)
+
+
+class Evaluator(object):
+    ''' FID and KID of a sampler against a dataset
+
+        feature extractor runs in the same graph as the generator and the input pipeline,
+        so that images never leave the device, only features are fetched.
+        statistics of real images are computed once and cached in cache_directory
+        keyed by dataset (cache name, which includes resolution, and fingerprint of files),
+        feature extractor and number of images
+    '''
+
+    def __init__(self, sampler, dataset, extractor, data_format, cache_directory="evaluation_cache",
+                 reservoir_size=10000):
+
+        self.sampler = sampler
+        self.dataset = dataset
+        self.extractor = extractor
+        self.cache_directory = cache_directory
+        self.reservoir_size = reservoir_size
+
+        reals = self.dataset.get_next()
+
+        if data_format == "channels_first":
+
+            reals = tf.transpose(reals, [0, 2, 3, 1])
+
+        with tf.name_scope("real_features"):
+            self.real_features = self.extractor(reals)
+
+        with tf.name_scope("fake_features"):
+            self.fake_features = self.extractor(self.sampler.fakes)
+
+    def real_statistics(self, filenames, num_images, batch_size):
+
+        filename = os.path.join(self.cache_directory, "{}_{}_{}_{}.npz".format(
+            self.dataset.cache_name(),
+            self.dataset.cache_fingerprint(filenames),
+            self.extractor.name,
+            num_images
+        ))
+
+        if os.path.exists(filename):
+
+            print("real statistics loaded from {}".format(filename))
+            return FeatureStatistics.load(filename)
+
+        session = tf.get_default_session()
+
+        self.dataset.initialize(
+            filenames=filenames,
+            num_epochs=1,
+            batch_size=batch_size,
+            buffer_size=1
+        )
+
+        statistics = None
+        count = 0
+
+        while count < num_images:
+
+            try:
+                features = session.run(self.real_features)
+
+            except tf.errors.OutOfRangeError:
+                break
+
+            if statistics is None:
+                statistics = FeatureStatistics(
+                    feature_size=features.shape[1],
+                    reservoir_size=self.reservoir_size
+                )
+
+            statistics.update(features[:num_images - count])
+            count = statistics.count
+
+        if statistics is None:
+            raise ValueError("No real images in dataset ({})".format(", ".join(filenames)))
+
+        if count < num_images:
+            print("only {} real images in dataset".format(count))
+
+        if not os.path.exists(self.cache_directory):
+            os.makedirs(self.cache_directory)
+
+        statistics.save(filename)
+        print("real statistics saved to {}".format(filename))
+
+        return statistics
+
+    def fake_statistics(self, num_images, batch_size, seed=0):
+
+        session = tf.get_default_session()
+
+        statistics = None
+
+        # same latents as Sampler.sample with the same seed
+        random_state = np.random.RandomState(seed)
+
+        for offset in range(0, num_images, batch_size):
+
+            latents = random_state.randn(min(batch_size, num_images - offset), self.sampler.latent_size)
+
+            features = session.run(self.fake_features, feed_dict={self.sampler.latents: latents})
+
+            if statistics is None:
+                statistics = FeatureStatistics(
+                    feature_size=features.shape[1],
+                    reservoir_size=self.reservoir_size
+                )
+
+            statistics.update(features)
+
+        return statistics
+
+    def evaluate(self, filenames, num_images, batch_size, seed=0, num_subsets=100, subset_size=1000):
+
+        real_statistics = self.real_statistics(filenames, num_images, batch_size)
+        fake_statistics = self.fake_statistics(num_images, batch_size, seed)
+
+        kid, kid_std = kernel_distance(
+            real_features=real_statistics.samples,
+            fake_features=fake_statistics.samples,
+            num_subsets=num_subsets,
+            subset_size=subset_size,
+            seed=seed
+        )
+
+        return dict(
+            fid=float(frechet_distance(real_statistics, fake_statistics)),
+            kid=float(kid),
+            kid_std=float(kid_std),
+            num_real_images=real_statistics.count,
+            num_fake_images=fake_statistics.count
+        )
@@ -0,0 +1,197 @@
+import tensorflow as tf
+import numpy as np
+import os
+from tensorflow.tools.graph_transforms import TransformGraph
+
+
+def node_name(name):
+
+    return name.split(":")[0].lstrip("^")
+
+
+def fold_batch_norms(graph_def):
+    ''' fold inference-mode batch normalization into preceding linear layer
+
+        pattern: (Conv2D | Conv2DBackpropInput | MatMul) -> (BiasAdd | Add) -> [Reshape] -> FusedBatchNorm
+        where weights and biases are constants (i.e. after freezing variables).
+        for MatMul -> Reshape into 4D (generator dense blocks),
+        per-channel parameters are expanded to per-unit ones by data_format of batch normalization.
+        kernel and bias are rescaled by gamma / sqrt(moving_variance + epsilon)
+        and FusedBatchNorm is replaced with Identity.
+        batch normalizations that don't match the pattern are left as they are.
+    '''
+
+    nodes = {node.name: node for node in graph_def.node}
+
+    def resolve(name):
+
+        node = nodes[node_name(name)]
+
+        while node.op == "Identity":
+            node = nodes[node_name(node.input[0])]
+
+        return node
+
+    def value(name):
+
+        node = resolve(name)
+
+        return tf.make_ndarray(node.attr["value"].tensor) if node.op == "Const" else None
+
+    consumed_outputs = set(
+        input for node in graph_def.node for input in node.input
+        if ":" in input and not input.endswith(":0")
+    )
+
+    # output index of filter (kernel) input and output channel axis of kernel
+    linear_ops = dict(
+        Conv2D=(1, 3),
+        Conv2DBackpropInput=(1, 2),
+        MatMul=(1, 1)
+    )
+
+    folded_graph_def = tf.GraphDef()
+    folded_graph_def.versions.CopyFrom(graph_def.versions)
+    folded_graph_def.library.CopyFrom(graph_def.library)
+
+    replaced_nodes = {}
+
+    for node in graph_def.node:
+
+        if node.op not in ["FusedBatchNorm", "FusedBatchNormV2"] or node.attr["is_training"].b:
+            continue
+
+        if any(input.startswith(node.name + ":") for input in consumed_outputs):
+            continue
+
+        scale, offset, mean, variance = [value(input) for input in node.input[1:5]]
+
+        if any(array is None for array in [scale, offset, mean, variance]):
+            continue
+
+        inputs = resolve(node.input[0])
+        reshaped = inputs.op == "Reshape"
+
+        if reshaped:
+            inputs = resolve(inputs.input[0])
+
+        if inputs.op not in ["BiasAdd", "Add", "AddV2"]:
+            continue
+
+        linear, bias = [resolve(input) for input in inputs.input]
+
+        if linear.op == "Const":
+            linear, bias = bias, linear
+
+        if linear.op not in linear_ops or bias.op != "Const":
+            continue
+
+        if linear.op == "MatMul" and (linear.attr["transpose_b"].b or linear.attr["transpose_a"].b):
+            continue
+
+        filter_index, channel_axis = linear_ops[linear.op]
+        kernel = resolve(linear.input[filter_index])
+
+        if kernel.op != "Const":
+            continue
+
+        kernel_value = tf.make_ndarray(kernel.attr["value"].tensor)
+        bias_value = tf.make_ndarray(bias.attr["value"].tensor)
+
+        num_units = kernel_value.shape[channel_axis]
+        num_channels = scale.shape[0]
+
+        if reshaped and linear.op == "MatMul" and num_units != num_channels and num_units % num_channels == 0:
+
+            #========================================================================#
+            # dense output [batch, units] reshaped into 4D in row-major order:
+            # channel of unit u is u % channels for NHWC (channels vary fastest)
+            # and u // (height * width) for NCHW (channels vary slowest)
+            #========================================================================#
+            repeats = num_units // num_channels
+
+            if node.attr["data_format"].s == b"NCHW":
+                scale, offset, mean, variance = [np.repeat(array, repeats) for array in [scale, offset, mean, variance]]
+
+            else:
+                scale, offset, mean, variance = [np.tile(array, repeats) for array in [scale, offset, mean, variance]]
+
+        # channels of batch normalization must be output channels of linear layer
+        if scale.shape != bias_value.shape or kernel_value.shape[channel_axis] != scale.shape[0]:
+            continue
+
+        multiplier = scale / np.sqrt(variance + node.attr["epsilon"].f)
+
+        shape = [1] * kernel_value.ndim
+        shape[channel_axis] = -1
+
+        kernel.attr["value"].CopyFrom(tf.AttrValue(tensor=tf.make_tensor_proto(
+            (kernel_value * np.reshape(multiplier, shape)).astype(kernel_value.dtype)
+        )))
+        bias.attr["value"].CopyFrom(tf.AttrValue(tensor=tf.make_tensor_proto(
+            ((bias_value - mean) * multiplier + offset).astype(bias_value.dtype)
+        )))
+
+        identity = tf.NodeDef()
+        identity.name = node.name
+        identity.op = "Identity"
+        identity.input.extend([node.input[0]])
+        identity.attr["T"].CopyFrom(node.attr["T"])
+
+        if node.device:
+            identity.device = node.device
+
+        replaced_nodes[node.name] = identity
+
+    for node in graph_def.node:
+        folded_graph_def.node.extend([replaced_nodes.get(node.name, node)])
+
+    return folded_graph_def
+
+
+def export(sampler, filename, as_text=False):
+    ''' write frozen generator graph for serving
+
+        only the subgraph from latents to fakes and images is kept,
+        with batch normalization using its moving statistics and folded into weights.
+        the graph has inputs "{name}/latents" and outputs "{name}/fakes", "{name}/images"
+        (and "{name}/fake_logits" if the sampler has a discriminator)
+        call this after sampler.restore()
+    '''
+
+    session = tf.get_default_session()
+
+    inputs = [sampler.latents.op.name]
+    outputs = [sampler.fakes.op.name, sampler.images.op.name]
+
+    if sampler.fake_logits is not None:
+        outputs.append(sampler.fake_logits.op.name)
+
+    graph_def = tf.graph_util.convert_variables_to_constants(
+        sess=session,
+        input_graph_def=session.graph.as_graph_def(),
+        output_node_names=outputs
+    )
+
+    graph_def = fold_batch_norms(graph_def)
+    graph_def = tf.graph_util.extract_sub_graph(graph_def, outputs)
+
+    graph_def = TransformGraph(
+        input_graph_def=graph_def,
+        inputs=inputs,
+        outputs=outputs,
+        transforms=[
+            "fold_constants(ignore_errors=true)",
+            "strip_unused_nodes",
+            "sort_by_execution_order"
+        ]
+    )
+
+    tf.train.write_graph(
+        graph_or_graph_def=graph_def,
+        logdir=os.path.dirname(filename) or ".",
+        name=os.path.basename(filename),
+        as_text=as_text
+    )
+
+    print("{} exported ({} nodes)".format(filename, len(graph_def.node)))
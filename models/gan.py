@@ -4,12 +4,45 @@ import os
 import itertools
 import time
 import cv2
+from utils import attr_dict
+from models import checkpoint
+from models import profiling
 
 
 def lerp(a, b, t):
     return a + (b - a) * t
 
 
+def average_gradients(tower_gradients):
+    ''' average gradients across towers
+
+        tower_gradients: list of [(gradient, variable)] for each tower,
+        in the same order of variables
+
+        variables without gradient (e.g. those of a pre-trained model in PGGAN style
+        that this model doesn't use) are dropped,
+        since LossScaleOptimizer.apply_gradients can't check None for finiteness
+    '''
+
+    average_gradients = []
+
+    for gradients_and_variables in zip(*tower_gradients):
+
+        gradients = [gradient for gradient, _ in gradients_and_variables]
+        variable = gradients_and_variables[0][1]
+
+        if any(gradient is None for gradient in gradients):
+            continue
+
+        if len(gradients) == 1:
+            average_gradients.append((gradients[0], variable))
+
+        else:
+            average_gradients.append((tf.add_n(gradients) / len(gradients), variable))
+
+    return average_gradients
+
+
 class Model(object):
 
     class LossFunction:
@@ -18,8 +51,17 @@ class Model(object):
     class GradientPenalty:
         ZERO_CENTERED, ONE_CENTERED = range(2)
 
-    def __init__(self, dataset, generator, discriminator, loss_function,
-                 gradient_penalty, hyper_params, name="gan", reuse=None):
+    class BatchNormUpdates:
+        ALL_TOWERS, FIRST_TOWER = range(2)
+
+    class GraphKeys:
+        BATCH_SIZE_PLACEHOLDERS = "batch_size_placeholders"
+        TRAINING_PLACEHOLDERS = "training_placeholders"
+
+    def __init__(self, dataset, generator, discriminator, loss_function, gradient_penalty,
+                 hyper_params, shared_discriminator_pass=False, devices=None,
+                 batch_norm_updates=BatchNormUpdates.ALL_TOWERS, compute_dtype=tf.float32,
+                 name="gan", reuse=None):
 
         # if train this model in PGGAN style
         # set reuse=tf.AUTO_REUSE
@@ -29,7 +71,41 @@ class Model(object):
             self.dataset = dataset
             self.generator = generator
             self.discriminator = discriminator
+            self.loss_function = loss_function
+            self.gradient_penalty_function = gradient_penalty
             self.hyper_parameters = hyper_params
+            self.shared_discriminator_pass = shared_discriminator_pass
+            self.devices = devices or [None]
+            self.compute_dtype = compute_dtype
+
+            #========================================================================#
+            # lazy regularization:
+            # evaluate gradient penalty only every gradient_penalty_interval steps
+            # with coefficient scaled by the interval, on the first
+            # gradient_penalty_fraction of the batch
+            #========================================================================#
+            self.gradient_penalty_interval = self.hyper_parameters.get("gradient_penalty_interval", 1)
+            self.gradient_penalty_fraction = self.hyper_parameters.get("gradient_penalty_fraction", 1.0)
+
+            #========================================================================#
+            # number of discriminator steps and generator steps in each training iteration
+            # (e.g. num_discriminator_steps=5 for WGAN-GP)
+            #========================================================================#
+            self.num_discriminator_steps = self.hyper_parameters.get("num_discriminator_steps", 1)
+            self.num_generator_steps = self.hyper_parameters.get("num_generator_steps", 1)
+
+            #========================================================================#
+            # with shared discriminator pass, fake logits come from the call over reals and fakes,
+            # so generator steps run alone (all but the first in an iteration)
+            # get their own train operation with a fakes-only discriminator call,
+            # which neither dequeues reals nor runs discriminator over them
+            #========================================================================#
+            self.generator_only_pass = self.shared_discriminator_pass and self.num_generator_steps > 1
+
+            #========================================================================#
+            # exponential moving average of generator variables (disabled if ema_decay is None)
+            #========================================================================#
+            self.ema_decay = self.hyper_parameters.get("ema_decay", None)
 
             self.batch_size = tf.placeholder(
                 dtype=tf.int32,
@@ -42,109 +118,104 @@ class Model(object):
                 name="training"
             )
 
+            # register placeholders in the graph,
+            # so that models trained on top of this one can feed them without searching the graph
+            tf.add_to_collection(Model.GraphKeys.BATCH_SIZE_PLACEHOLDERS, self.batch_size)
+            tf.add_to_collection(Model.GraphKeys.TRAINING_PLACEHOLDERS, self.training)
+
             self.next_reals = self.dataset.get_next()
             self.next_latents = tf.random_normal(shape=[self.batch_size, self.hyper_parameters.latent_size])
 
-            self.reals = tf.placeholder(
-                dtype=tf.float32,
+            #========================================================================#
+            # reals and latents default to the input pipeline and the in-graph sampler,
+            # so that a training step needs no host round-trip through feed_dict.
+            # feed them explicitly only to override (e.g. for inference or debugging)
+            #========================================================================#
+            self.reals = tf.placeholder_with_default(
+                input=self.next_reals,
                 shape=self.next_reals.shape,
                 name="reals"
             )
-            self.latents = tf.placeholder(
-                dtype=tf.float32,
+            self.latents = tf.placeholder_with_default(
+                input=self.next_latents,
                 shape=[None, self.hyper_parameters.latent_size],
                 name="latents"
             )
 
-            self.fakes = generator(
-                inputs=self.latents,
-                training=self.training,
-                name="generator"
-            )
-
-            self.real_logits = discriminator(
-                inputs=self.reals,
-                training=self.training,
-                name="discriminator"
-            )
-            self.fake_logits = discriminator(
-                inputs=self.fakes,
-                training=self.training,
-                name="discriminator",
-                reuse=True
-            )
-
             #========================================================================#
-            # two types of loss function
-            # 1. NS-GAN loss function (https://arxiv.org/pdf/1406.2661.pdf)
-            # 2. WGAN loss function (https://arxiv.org/pdf/1701.07875.pdf)
+            # mixed precision:
+            # networks compute in compute_dtype (e.g. float16) with float32 variables,
+            # and losses are computed in float32.
+            # for float16, losses are scaled dynamically to avoid underflow of gradients
+            # (https://arxiv.org/pdf/1710.03740.pdf)
             #========================================================================#
-            if loss_function == Model.LossFunction.NS_GAN:
+            if self.compute_dtype == tf.float16:
 
-                self.generator_loss = tf.reduce_mean(
-                    tf.nn.sigmoid_cross_entropy_with_logits(
-                        logits=self.fake_logits,
-                        labels=tf.ones_like(self.fake_logits)
-                    )
+                self.generator_loss_scale_manager = tf.contrib.mixed_precision.ExponentialUpdateLossScaleManager(
+                    init_loss_scale=2 ** 15,
+                    incr_every_n_steps=1000
                 )
-
-                self.discriminator_loss = tf.reduce_mean(
-                    tf.nn.sigmoid_cross_entropy_with_logits(
-                        logits=self.real_logits,
-                        labels=tf.ones_like(self.real_logits)
-                    )
-                )
-                self.discriminator_loss += tf.reduce_mean(
-                    tf.nn.sigmoid_cross_entropy_with_logits(
-                        logits=self.fake_logits,
-                        labels=tf.zeros_like(self.fake_logits)
-                    )
+                self.discriminator_loss_scale_manager = tf.contrib.mixed_precision.ExponentialUpdateLossScaleManager(
+                    init_loss_scale=2 ** 15,
+                    incr_every_n_steps=1000
                 )
 
-            elif loss_function == Model.LossFunction.WGAN:
+            else:
 
-                self.generator_loss = -tf.reduce_mean(self.fake_logits)
+                self.generator_loss_scale_manager = None
+                self.discriminator_loss_scale_manager = None
 
-                self.discriminator_loss = -tf.reduce_mean(self.real_logits)
-                self.discriminator_loss += tf.reduce_mean(self.fake_logits)
+            # update operations of pre-trained models built before this model
+            pretrained_update_ops = tf.get_collection(tf.GraphKeys.UPDATE_OPS)
 
-            else:
-                raise ValueError("Invalid loss function")
-
-            #========================================================================#
-            # linear interpolation for gradient penalty
-            #========================================================================#
-            self.lerp_coefficients = tf.random_uniform(shape=[self.batch_size, 1, 1, 1])
-            self.lerped = lerp(self.reals, self.fakes, self.lerp_coefficients)
-            self.lerped_logits = discriminator(
-                inputs=self.lerped,
-                training=self.training,
-                name="discriminator",
-                reuse=True
-            )
             #========================================================================#
-            # two types of gradient penalty
-            # 1. zero-centered gradient penalty (https://openreview.net/pdf?id=ByxPYjC5KQ)
-            # -> NOT EFFECTIVE FOR NOW
-            # 2. one-centered gradient penalty (https://arxiv.org/pdf/1704.00028.pdf)
-            # to avoid NaN exception, add epsilon inside sqrt()
-            # (https://github.com/tdeboissiere/DeepLearningImplementations/issues/68)
+            # data-parallel training:
+            # split batch into sub-batches, build a tower (generator, discriminator and losses)
+            # for each sub-batch on each device with shared variables,
+            # and average gradients across towers.
+            # batch size must be divisible by number of devices.
+            # batch normalization always uses batch statistics of each tower.
+            # moving statistics are updated by all towers (ALL_TOWERS)
+            # or only by the first tower (FIRST_TOWER)
             #========================================================================#
-            self.gradients = tf.gradients(ys=self.lerped_logits, xs=self.lerped)[0]
-            self.slopes = tf.sqrt(tf.reduce_sum(tf.square(self.gradients), axis=[1, 2, 3]) + 0.0001)
+            self.towers = []
 
-            if gradient_penalty == Model.GradientPenalty.ZERO_CENTERED:
+            for index, (device, reals, latents) in enumerate(zip(
+                self.devices,
+                tf.split(self.reals, len(self.devices)),
+                tf.split(self.latents, len(self.devices))
+            )):
 
-                self.gradient_penalty = tf.reduce_mean(tf.square(self.slopes - 0.0))
+                with tf.device(device), tf.name_scope("tower_{}".format(index)) as scope:
 
-            elif gradient_penalty == Model.GradientPenalty.ONE_CENTERED:
+                    tower = self.build_tower(
+                        reals=reals,
+                        latents=latents,
+                        reuse=True if index else None
+                    )
+                    tower.update_ops = tf.get_collection(tf.GraphKeys.UPDATE_OPS, scope)
 
-                self.gradient_penalty = tf.reduce_mean(tf.square(self.slopes - 1.0))
+                    self.towers.append(tower)
 
-            else:
-                raise ValueError("Invalid gradient penalty")
+            def concat(name):
+                return tf.concat([tower[name] for tower in self.towers], axis=0)
 
-            self.discriminator_loss += self.gradient_penalty * self.hyper_parameters.gradient_coefficient
+            def mean(name):
+                return tf.add_n([tower[name] for tower in self.towers]) / len(self.towers)
+
+            self.fakes = concat("fakes")
+            self.lerped = concat("lerped")
+            self.real_logits = concat("real_logits")
+            self.fake_logits = concat("fake_logits")
+            self.lerped_logits = concat("lerped_logits")
+
+            self.generator_loss = mean("generator_loss")
+
+            if self.generator_only_pass:
+                self.generator_only_loss = mean("generator_only_loss")
+            self.adversarial_discriminator_loss = mean("adversarial_discriminator_loss")
+            self.gradient_penalty = mean("gradient_penalty")
+            self.discriminator_loss = mean("discriminator_loss")
 
             self.generator_variables = tf.get_collection(
                 key=tf.GraphKeys.TRAINABLE_VARIABLES,
@@ -170,6 +241,22 @@ class Model(object):
                 trainable=False
             )
 
+            if self.ema_decay:
+
+                #========================================================================#
+                # shadow variables are named as tf.train.ExponentialMovingAverage does
+                # ("{variable}/ExponentialMovingAverage"), saved in checkpoints,
+                # and shared with pre-trained models in PGGAN style like the variables themselves.
+                # they start from the initial values of the variables
+                #========================================================================#
+                self.generator_averages = [
+                    tf.get_variable(
+                        name="{}/ExponentialMovingAverage".format(variable.op.name[len(self.name) + 1:]),
+                        initializer=variable.initialized_value(),
+                        trainable=False
+                    ) for variable in self.generator_variables
+                ]
+
             self.generator_optimizer = tf.train.AdamOptimizer(
                 learning_rate=self.hyper_parameters.learning_rate,
                 beta1=self.hyper_parameters.beta1,
@@ -181,36 +268,456 @@ class Model(object):
                 beta2=self.hyper_parameters.beta2
             )
 
+            if self.compute_dtype == tf.float16:
+
+                self.generator_optimizer = tf.contrib.mixed_precision.LossScaleOptimizer(
+                    opt=self.generator_optimizer,
+                    loss_scale_manager=self.generator_loss_scale_manager
+                )
+                self.discriminator_optimizer = tf.contrib.mixed_precision.LossScaleOptimizer(
+                    opt=self.discriminator_optimizer,
+                    loss_scale_manager=self.discriminator_loss_scale_manager
+                )
+
+            self.generator_gradients = average_gradients([
+                self.generator_optimizer.compute_gradients(
+                    loss=tower.generator_loss,
+                    var_list=self.generator_variables,
+                    colocate_gradients_with_ops=True
+                ) for tower in self.towers
+            ])
+
+            if self.generator_only_pass:
+
+                self.generator_only_gradients = average_gradients([
+                    self.generator_optimizer.compute_gradients(
+                        loss=tower.generator_only_loss,
+                        var_list=self.generator_variables,
+                        colocate_gradients_with_ops=True
+                    ) for tower in self.towers
+                ])
+
+            if self.gradient_penalty_interval == 1:
+
+                self.discriminator_gradients = average_gradients([
+                    self.discriminator_optimizer.compute_gradients(
+                        loss=tower.discriminator_loss,
+                        var_list=self.discriminator_variables,
+                        colocate_gradients_with_ops=True
+                    ) for tower in self.towers
+                ])
+
+                self.discriminator_penalty_gradients = self.discriminator_gradients
+
+            else:
+
+                # gradients without gradient penalty
+                self.discriminator_gradients = average_gradients([
+                    self.discriminator_optimizer.compute_gradients(
+                        loss=tower.adversarial_discriminator_loss,
+                        var_list=self.discriminator_variables,
+                        colocate_gradients_with_ops=True
+                    ) for tower in self.towers
+                ])
+
+                # gradients with gradient penalty for every gradient_penalty_interval steps
+                self.discriminator_penalty_gradients = average_gradients([
+                    self.discriminator_optimizer.compute_gradients(
+                        loss=(tower.adversarial_discriminator_loss + tower.gradient_penalty *
+                              self.hyper_parameters.gradient_coefficient * self.gradient_penalty_interval),
+                        var_list=self.discriminator_variables,
+                        colocate_gradients_with_ops=True
+                    ) for tower in self.towers
+                ])
+
+            if batch_norm_updates == Model.BatchNormUpdates.ALL_TOWERS:
+
+                update_ops = [update_op for tower in self.towers for update_op in tower.update_ops]
+
+            elif batch_norm_updates == Model.BatchNormUpdates.FIRST_TOWER:
+
+                update_ops = self.towers[0].update_ops
+
+            else:
+                raise ValueError("Invalid batch norm updates")
+
+            #========================================================================#
+            # streaming metrics:
+            # losses are accumulated into running means by train operations,
+            # so that logging reads the means without running networks again.
+            # gradient penalty is accumulated only when it is evaluated
+            #========================================================================#
+            num_metric_variables = len(tf.get_collection(tf.GraphKeys.METRIC_VARIABLES))
+
+            with tf.variable_scope("metrics"):
+
+                self.generator_loss_mean, generator_loss_update_op = tf.metrics.mean(
+                    values=self.generator_loss,
+                    name="generator_loss"
+                )
+                self.adversarial_discriminator_loss_mean, adversarial_discriminator_loss_update_op = tf.metrics.mean(
+                    values=self.adversarial_discriminator_loss,
+                    name="adversarial_discriminator_loss"
+                )
+                self.gradient_penalty_mean, gradient_penalty_update_op = tf.metrics.mean(
+                    values=self.gradient_penalty,
+                    name="gradient_penalty"
+                )
+
+                if self.generator_only_pass:
+
+                    generator_only_loss_mean, generator_only_loss_update_op = tf.metrics.mean(
+                        values=self.generator_only_loss,
+                        name="generator_only_loss"
+                    )
+
+            if self.generator_only_pass:
+
+                # every iteration has one generator step with the shared pass
+                # and num_generator_steps - 1 alone, and metrics are read between iterations
+                self.generator_loss_mean = ((self.generator_loss_mean + generator_only_loss_mean *
+                                             (self.num_generator_steps - 1)) / self.num_generator_steps)
+
+            # in lazy regularization, penalty is weighted by interval but applied every interval steps,
+            # so its contribution per step is the same on average
+            self.discriminator_loss_mean = (self.adversarial_discriminator_loss_mean +
+                                            self.gradient_penalty_mean * self.hyper_parameters.gradient_coefficient)
+
+            self.metric_variables = tf.get_collection(tf.GraphKeys.METRIC_VARIABLES)[num_metric_variables:]
+            self.metrics_initializer = tf.variables_initializer(self.metric_variables)
+
             #========================================================================#
             # to update moving_mean and moving_variance
             # for batch normalization when trainig,
             # run update operation before train operation
             # update operation is placed in tf.GraphKeys.UPDATE_OPS
             #========================================================================#
-            with tf.control_dependencies(tf.get_collection(tf.GraphKeys.UPDATE_OPS)):
+            with tf.control_dependencies(pretrained_update_ops + update_ops):
 
-                self.generator_train_op = self.generator_optimizer.minimize(
-                    loss=self.generator_loss,
-                    var_list=self.generator_variables,
+                def generator_train_op(gradients, loss_update_op):
+
+                    generator_apply_op = self.generator_optimizer.apply_gradients(
+                        grads_and_vars=gradients,
+                        global_step=self.generator_global_step
+                    )
+
+                    if self.ema_decay:
+
+                        # averages are updated with the new variables after each generator step
+                        with tf.control_dependencies([generator_apply_op]):
+
+                            generator_apply_op = self.update_generator_averages()
+
+                    return tf.group(
+                        generator_apply_op,
+                        loss_update_op
+                    )
+
+                self.generator_train_op = generator_train_op(
+                    gradients=self.generator_gradients,
+                    loss_update_op=generator_loss_update_op
+                )
+
+                # train operation for generator steps run alone
+                if self.generator_only_pass:
+
+                    self.generator_only_train_op = generator_train_op(
+                        gradients=self.generator_only_gradients,
+                        loss_update_op=generator_only_loss_update_op
+                    )
+
+                else:
+
+                    self.generator_only_train_op = self.generator_train_op
+
+                if self.gradient_penalty_interval == 1:
+
+                    self.discriminator_train_op = tf.group(
+                        self.discriminator_optimizer.apply_gradients(
+                            grads_and_vars=self.discriminator_gradients,
+                            global_step=self.discriminator_global_step
+                        ),
+                        adversarial_discriminator_loss_update_op,
+                        gradient_penalty_update_op
+                    )
+
+                    self.discriminator_penalty_train_op = self.discriminator_train_op
+
+                else:
+
+                    self.discriminator_train_op = tf.group(
+                        self.discriminator_optimizer.apply_gradients(
+                            grads_and_vars=self.discriminator_gradients,
+                            global_step=self.discriminator_global_step
+                        ),
+                        adversarial_discriminator_loss_update_op
+                    )
+
+                    self.discriminator_penalty_train_op = tf.group(
+                        self.discriminator_optimizer.apply_gradients(
+                            grads_and_vars=self.discriminator_penalty_gradients,
+                            global_step=self.discriminator_global_step
+                        ),
+                        adversarial_discriminator_loss_update_op,
+                        gradient_penalty_update_op
+                    )
+
+            #========================================================================#
+            # global steps read after each train operation, to be fetched with it.
+            # with float16, LossScaleOptimizer skips the whole update (global step included)
+            # when gradients overflow, so steps can't be counted on host
+            #========================================================================#
+            def global_step_after(train_op, global_step):
+
+                with tf.control_dependencies([train_op]):
+                    return global_step.read_value()
+
+            self.generator_train_step = global_step_after(
+                train_op=self.generator_train_op,
+                global_step=self.generator_global_step
+            )
+            self.discriminator_train_step = global_step_after(
+                train_op=self.discriminator_train_op,
+                global_step=self.discriminator_global_step
+            )
+
+            if self.generator_only_pass:
+
+                self.generator_only_train_step = global_step_after(
+                    train_op=self.generator_only_train_op,
                     global_step=self.generator_global_step
                 )
 
-                self.discriminator_train_op = self.discriminator_optimizer.minimize(
-                    loss=self.discriminator_loss,
-                    var_list=self.discriminator_variables,
+            else:
+
+                self.generator_only_train_step = self.generator_train_step
+
+            if self.gradient_penalty_interval == 1:
+
+                self.discriminator_penalty_train_step = self.discriminator_train_step
+
+            else:
+
+                self.discriminator_penalty_train_step = global_step_after(
+                    train_op=self.discriminator_penalty_train_op,
                     global_step=self.discriminator_global_step
                 )
 
-            self.saver = tf.train.Saver()
+            # variables the saver covers (those existing when this model is built),
+            # the checkpoint writer snapshots the same list, since variables of models
+            # built later in the graph (e.g. PGGAN stacking) may not be initialized yet
+            self.saved_variables = tf.global_variables()
+            self.saver = tf.train.Saver(var_list=self.saved_variables)
+
+            # scalar summary reads streaming metrics only
+            scalar_summaries = [
+                tf.summary.scalar("generator_loss", self.generator_loss_mean),
+                tf.summary.scalar("discriminator_loss", self.discriminator_loss_mean),
+                tf.summary.scalar("gradient_penalty", self.gradient_penalty_mean),
+            ]
+
+            # statistics of input pipeline (latencies, prefetch buffer utilization) if collected
+            if self.dataset.statistics_summary is not None:
+                scalar_summaries.append(self.dataset.statistics_summary)
 
-            self.summary = tf.summary.merge([
+            self.scalar_summary = tf.summary.merge(scalar_summaries)
+
+            # image summary depends on the current batch,
+            # so it is fetched together with train operations
+            self.image_summary = tf.summary.merge([
                 tf.summary.image("reals", self.reals, max_outputs=10),
                 tf.summary.image("fakes", self.fakes, max_outputs=10),
-                tf.summary.scalar("generator_loss", self.generator_loss),
-                tf.summary.scalar("discriminator_loss", self.discriminator_loss),
-                tf.summary.scalar("gradient_penalty", self.gradient_penalty),
             ])
 
+    def update_generator_averages(self):
+        ''' update exponential moving averages of generator variables
+
+            decay is warmed up as tf.train.ExponentialMovingAverage does with num_updates,
+            min(ema_decay, (1 + step) / (10 + step)),
+            so that averages are usable after a small number of steps
+        '''
+
+        step = tf.cast(self.generator_global_step, tf.float32)
+        decay = tf.minimum(self.ema_decay, (1.0 + step) / (10.0 + step))
+
+        return tf.group(*[
+            tf.assign_sub(average, (average - variable) * (1.0 - decay))
+            for variable, average in zip(self.generator_variables, self.generator_averages)
+        ], name="update_generator_averages")
+
+    def build_tower(self, reals, latents, reuse=None):
+        ''' generator, discriminator and losses for a sub-batch '''
+
+        tower = attr_dict.AttrDict()
+
+        tower.fakes = self.generator(
+            inputs=tf.cast(latents, self.compute_dtype),
+            training=self.training,
+            name="generator",
+            reuse=reuse
+        )
+        tower.fakes = tf.cast(tower.fakes, tf.float32)
+
+        #========================================================================#
+        # linear interpolation for gradient penalty
+        #========================================================================#
+        batch_size = tf.shape(reals)[0]
+        lerp_coefficients = tf.random_uniform(shape=[batch_size, 1, 1, 1])
+
+        if self.gradient_penalty_fraction < 1.0:
+
+            num_lerped = tf.cast(tf.ceil(tf.cast(batch_size, tf.float32) * self.gradient_penalty_fraction), tf.int32)
+            tower.lerped = lerp(reals[:num_lerped], tower.fakes[:num_lerped], lerp_coefficients[:num_lerped])
+
+        else:
+
+            tower.lerped = lerp(reals, tower.fakes, lerp_coefficients)
+
+        #========================================================================#
+        # shared discriminator pass:
+        # run discriminator once over concatenated reals and fakes,
+        # then split logits, which saves kernel launches and spectral normalization.
+        # this is exact only if discriminator has no op across samples
+        # (e.g. batch normalization), which holds for dcgan and resnet.
+        # lerped is always evaluated in its own call,
+        # since gradient penalty differentiates logits w.r.t. lerped twice
+        # (tf.gradients, then gradients of the penalty),
+        # and both backward passes would otherwise run over the whole concatenated batch.
+        # this also lets lazy regularization skip it on steps without penalty
+        #========================================================================#
+        if self.shared_discriminator_pass:
+
+            tower.real_logits, tower.fake_logits = tf.split(
+                value=self.discriminate(
+                    inputs=tf.concat([reals, tower.fakes], axis=0),
+                    reuse=reuse
+                ),
+                num_or_size_splits=tf.stack([tf.shape(reals)[0], tf.shape(tower.fakes)[0]]),
+                num=2,
+                axis=0
+            )
+
+        else:
+
+            tower.real_logits = self.discriminate(
+                inputs=reals,
+                reuse=reuse
+            )
+            tower.fake_logits = self.discriminate(
+                inputs=tower.fakes,
+                reuse=True
+            )
+
+        tower.lerped_logits = self.discriminate(
+            inputs=tower.lerped,
+            reuse=True
+        )
+
+        #========================================================================#
+        # two types of loss function
+        # 1. NS-GAN loss function (https://arxiv.org/pdf/1406.2661.pdf)
+        # 2. WGAN loss function (https://arxiv.org/pdf/1701.07875.pdf)
+        #========================================================================#
+        tower.generator_loss = self.adversarial_generator_loss(tower.fake_logits)
+
+        if self.generator_only_pass:
+
+            tower.generator_only_fake_logits = self.discriminate(
+                inputs=tower.fakes,
+                reuse=True
+            )
+            tower.generator_only_loss = self.adversarial_generator_loss(tower.generator_only_fake_logits)
+
+        if self.loss_function == Model.LossFunction.NS_GAN:
+
+            tower.adversarial_discriminator_loss = tf.reduce_mean(
+                tf.nn.sigmoid_cross_entropy_with_logits(
+                    logits=tower.real_logits,
+                    labels=tf.ones_like(tower.real_logits)
+                )
+            )
+            tower.adversarial_discriminator_loss += tf.reduce_mean(
+                tf.nn.sigmoid_cross_entropy_with_logits(
+                    logits=tower.fake_logits,
+                    labels=tf.zeros_like(tower.fake_logits)
+                )
+            )
+
+        elif self.loss_function == Model.LossFunction.WGAN:
+
+            tower.adversarial_discriminator_loss = -tf.reduce_mean(tower.real_logits)
+            tower.adversarial_discriminator_loss += tf.reduce_mean(tower.fake_logits)
+
+        else:
+            raise ValueError("Invalid loss function")
+
+        #========================================================================#
+        # two types of gradient penalty
+        # 1. zero-centered gradient penalty (https://openreview.net/pdf?id=ByxPYjC5KQ)
+        # -> NOT EFFECTIVE FOR NOW
+        # 2. one-centered gradient penalty (https://arxiv.org/pdf/1704.00028.pdf)
+        # to avoid NaN exception, add epsilon inside sqrt()
+        # (https://github.com/tdeboissiere/DeepLearningImplementations/issues/68)
+        #========================================================================#
+        if self.discriminator_loss_scale_manager:
+
+            # scale inner gradients as well as outer ones to avoid underflow
+            loss_scale = self.discriminator_loss_scale_manager.get_loss_scale()
+            tower.gradients = tf.gradients(ys=tower.lerped_logits * loss_scale, xs=tower.lerped)[0] / loss_scale
+
+        else:
+
+            tower.gradients = tf.gradients(ys=tower.lerped_logits, xs=tower.lerped)[0]
+
+        tower.slopes = tf.sqrt(tf.reduce_sum(tf.square(tower.gradients), axis=[1, 2, 3]) + 0.0001)
+
+        if self.gradient_penalty_function == Model.GradientPenalty.ZERO_CENTERED:
+
+            tower.gradient_penalty = tf.reduce_mean(tf.square(tower.slopes - 0.0))
+
+        elif self.gradient_penalty_function == Model.GradientPenalty.ONE_CENTERED:
+
+            tower.gradient_penalty = tf.reduce_mean(tf.square(tower.slopes - 1.0))
+
+        else:
+            raise ValueError("Invalid gradient penalty")
+
+        tower.discriminator_loss = (tower.adversarial_discriminator_loss +
+                                    tower.gradient_penalty * self.hyper_parameters.gradient_coefficient)
+
+        return tower
+
+    def adversarial_generator_loss(self, fake_logits):
+        ''' generator loss of fake logits for the loss function '''
+
+        if self.loss_function == Model.LossFunction.NS_GAN:
+
+            return tf.reduce_mean(
+                tf.nn.sigmoid_cross_entropy_with_logits(
+                    logits=fake_logits,
+                    labels=tf.ones_like(fake_logits)
+                )
+            )
+
+        elif self.loss_function == Model.LossFunction.WGAN:
+
+            return -tf.reduce_mean(fake_logits)
+
+        else:
+            raise ValueError("Invalid loss function")
+
+    def discriminate(self, inputs, reuse=None):
+        ''' discriminator logits in float32 for float32 inputs '''
+
+        logits = self.discriminator(
+            inputs=tf.cast(inputs, self.compute_dtype),
+            training=self.training,
+            name="discriminator",
+            reuse=reuse
+        )
+
+        return tf.cast(logits, tf.float32)
+
     # call this when train model untrained or still training
     # in this case, model can restore variables from checkpoint.
     def initialize(self):
@@ -234,23 +741,28 @@ class Model(object):
 
         session = tf.get_default_session()
 
+        global_variables = tf.global_variables(self.name)
+
+        # query all variables in a single run
+        uninitialized_variable_names = set(session.run(tf.report_uninitialized_variables(global_variables)))
+
         uninitialized_variables = [
-            variable for variable in tf.global_variables(self.name)
-            if not session.run(tf.is_variable_initialized(variable))
+            variable for variable in global_variables
+            if variable.op.name.encode() in uninitialized_variable_names
         ]
 
         session.run(tf.variables_initializer(uninitialized_variables))
         print("uninitialized variables in {} initialized".format(self.name))
 
-    def train(self, filenames, num_epochs, batch_size, buffer_size):
+    def train(self, filenames, num_epochs, batch_size, buffer_size,
+              checkpoint_steps=100000, checkpoint_secs=None, max_to_keep=5, keep_checkpoint_every_n_hours=10000.0,
+              profile_steps=None):
 
         session = tf.get_default_session()
         writer = tf.summary.FileWriter(self.name, session.graph)
 
         print("training started")
 
-        start = time.time()
-
         self.dataset.initialize(
             filenames=filenames,
             num_epochs=num_epochs,
@@ -258,78 +770,158 @@ class Model(object):
             buffer_size=buffer_size
         )
 
-        feed_dict = {
-            self.batch_size: batch_size,
-            self.training: True
-        }
-
         ### [CAUTION] ###
         # variables in pre-trained model depends placeholders that doesn't exist in this instance.
-        # so, search those placeholders in graph, and feed values to them.
-        latents_placeholder_names = [
-            "{}:0".format(operation.name)
-            for operation in tf.get_default_graph().get_operations()
-            if "latents" in operation.name
-        ]
+        # so, feed values to placeholders registered by all models including this one.
+        # latents of pre-trained model default to its own in-graph sampler,
+        # which depends on its own batch_size placeholder.
+        feed_dict = {}
+
+        feed_dict.update({
+            batch_size_placeholder: batch_size
+            for batch_size_placeholder in tf.get_collection(Model.GraphKeys.BATCH_SIZE_PLACEHOLDERS)
+        })
+
+        feed_dict.update({
+            training_placeholder: True
+            for training_placeholder in tf.get_collection(Model.GraphKeys.TRAINING_PLACEHOLDERS)
+        })
+
+        generator_global_step, discriminator_global_step = session.run(
+            [self.generator_global_step, self.discriminator_global_step]
+        )
 
-        training_placeholder_names = [
-            "{}:0".format(operation.name)
-            for operation in tf.get_default_graph().get_operations()
-            if "training" in operation.name
-        ]
+        session.run(self.metrics_initializer)
+
+        #========================================================================#
+        # checkpoints are written in background every checkpoint_steps steps
+        # and/or every checkpoint_secs seconds, and at the end of training
+        # unless the last step was just saved
+        #========================================================================#
+        checkpoint_writer = checkpoint.CheckpointWriter(
+            session=session,
+            variables=self.saved_variables,
+            directory=self.name,
+            global_step=generator_global_step,
+            save_steps=checkpoint_steps,
+            save_secs=checkpoint_secs,
+            max_to_keep=max_to_keep,
+            keep_checkpoint_every_n_hours=keep_checkpoint_every_n_hours
+        )
 
-        latents_placeholders = [
-            tf.get_default_graph().get_tensor_by_name(latents_placeholder_name)
-            for latents_placeholder_name in latents_placeholder_names
-        ]
+        #========================================================================#
+        # profiling (enabled if profile_steps is given):
+        # wall time of train, summary and checkpoint phases is reported with losses,
+        # and every profile_steps steps the combined train run is traced
+        # into a chrome trace timeline and per-layer op costs in "{name}/profile".
+        # runs are the same as without profiling (reals come from the input pipeline in graph),
+        # only traced runs get RunOptions, so train time includes waiting for input.
+        # input latency (e.g. input/prefetch_latency) is reported with profile phases
+        # by dataset statistics, which main.py collects whenever profiling
+        #========================================================================#
+        profiler = profiling.Profiler(
+            directory=os.path.join(self.name, "profile"),
+            name=self.name,
+            enabled=bool(profile_steps)
+        )
 
-        training_placeholders = [
-            tf.get_default_graph().get_tensor_by_name(training_placeholder_name)
-            for training_placeholder_name in training_placeholder_names
-        ]
+        def run(fetches, trace=False):
+
+            return profiler.run(
+                session=session,
+                fetches=fetches,
+                feed_dict=feed_dict,
+                global_step=generator_global_step,
+                trace=trace
+            )
+
+        def crossed(interval):
+            return (generator_global_step + self.num_generator_steps) // interval > generator_global_step // interval
+
+        num_steps = 0
+
+        logging_iteration = 0
+        logging_time = time.time()
 
         for i in itertools.count():
 
+            # whether to log is decided before the step,
+            # so that image summary is fetched in the same run as train operations
+            logging = crossed(100)
+            image_logging = crossed(1000)
+            tracing = bool(profile_steps) and crossed(profile_steps)
+
             try:
-                reals, latents = session.run(
-                    [self.next_reals, self.next_latents],
-                    feed_dict=feed_dict
-                )
+                #========================================================================#
+                # discriminator steps except the last one run alone on fresh batches,
+                # the last one runs with the first generator step in a single session.run,
+                # where both train operations depend on the same fakes (and fake logits),
+                # so the generator forward pass runs once for both.
+                # (both updates use the networks from before this run,
+                # i.e. simultaneous rather than alternating updates for this pair)
+                # generator steps after the first one draw new latents on purpose,
+                # since reusing fakes of updated generator variables would be stale,
+                # and run generator_only_train_op, which never dequeues reals
+                #========================================================================#
+                for _ in range(self.num_discriminator_steps - 1):
+
+                    _, discriminator_global_step = run(self.select_discriminator_train_op(discriminator_global_step))
+
+                fetches = [self.generator_train_op, self.generator_train_step]
+                fetches += self.select_discriminator_train_op(discriminator_global_step)
+
+                if image_logging:
+                    fetches.append(self.image_summary)
+
+                results = run(fetches, trace=tracing)
+
+                generator_global_step = results[1]
+                discriminator_global_step = results[3]
+
+                for _ in range(self.num_generator_steps - 1):
+
+                    _, generator_global_step = run([self.generator_only_train_op, self.generator_only_train_step])
 
             except tf.errors.OutOfRangeError:
                 print("training ended")
                 break
 
-            feed_dict.update({
-                self.reals: reals,
-                self.latents: latents
-            })
+            num_steps += 1
 
-            feed_dict.update({
-                latents_placeholder: latents
-                for latents_placeholder in latents_placeholders
-            })
+            with profiler.phase("summary"):
 
-            feed_dict.update({
-                training_placeholder: True
-                for training_placeholder in training_placeholders
-            })
+                if image_logging:
 
-            session.run(
-                [self.generator_train_op, self.discriminator_train_op],
-                feed_dict=feed_dict
-            )
+                    writer.add_summary(results[4], global_step=generator_global_step)
 
-            generator_global_step, discriminator_global_step = session.run(
-                [self.generator_global_step, self.discriminator_global_step]
-            )
+                if logging:
 
-            if generator_global_step % 100 == 0:
+                    # streaming metrics only read accumulated variables
+                    generator_loss, discriminator_loss, scalar_summary = session.run(
+                        [self.generator_loss_mean, self.discriminator_loss_mean, self.scalar_summary]
+                    )
+                    session.run(self.metrics_initializer)
 
-                generator_loss, discriminator_loss = session.run(
-                    [self.generator_loss, self.discriminator_loss],
-                    feed_dict=feed_dict
-                )
+                    writer.add_summary(scalar_summary, global_step=generator_global_step)
+
+                    #========================================================================#
+                    # input throughput since the last logging,
+                    # each iteration consumes a batch for each discriminator step only,
+                    # generator steps run alone depend on latents but never on reals
+                    # (generator_only_train_op, also with shared discriminator pass)
+                    #========================================================================#
+                    records_per_sec = ((i + 1 - logging_iteration) * self.num_discriminator_steps * batch_size /
+                                       (time.time() - logging_time))
+
+                    logging_iteration = i + 1
+                    logging_time = time.time()
+
+                    writer.add_summary(
+                        tf.Summary(value=[tf.Summary.Value(tag="input/records_per_sec", simple_value=records_per_sec)]),
+                        global_step=generator_global_step
+                    )
+
+            if logging:
 
                 print("global_step: {}, generator_loss: {:.2f}".format(
                     generator_global_step,
@@ -339,25 +931,29 @@ class Model(object):
                     discriminator_global_step,
                     discriminator_loss
                 ))
+                print("global_step: {}, records_per_sec: {:.2f}".format(
+                    generator_global_step,
+                    records_per_sec
+                ))
 
-                summary = session.run(self.summary, feed_dict=feed_dict)
-                writer.add_summary(summary, global_step=generator_global_step)
+                if profiler.enabled:
 
-                if generator_global_step % 100000 == 0:
+                    writer.add_summary(profiler.phase_summary(num_steps), global_step=generator_global_step)
+                    num_steps = 0
 
-                    checkpoint = self.saver.save(
-                        sess=session,
-                        save_path=os.path.join(self.name, "model.ckpt"),
-                        global_step=generator_global_step
-                    )
+            with profiler.phase("checkpoint"):
 
-                    tf.train.write_graph(
-                        graph_or_graph_def=session.graph.as_graph_def(),
-                        logdir=self.name,
-                        name="graph.pb",
-                        as_text=False
-                    )
+                checkpoint_writer.maybe_save(generator_global_step)
+
+        checkpoint_writer.save_if_new(generator_global_step)
+        checkpoint_writer.close()
+
+    def select_discriminator_train_op(self, discriminator_global_step):
+        ''' discriminator train operation for the next step in lazy regularization
+            and the discriminator global step after it, as fetches of one session.run
+        '''
+
+        if discriminator_global_step % self.gradient_penalty_interval == 0:
+            return [self.discriminator_penalty_train_op, self.discriminator_penalty_train_step]
 
-                    stop = time.time()
-                    print("{} saved ({:.2f} sec)".format(checkpoint, stop - start))
-                    start = time.time()
+        return [self.discriminator_train_op, self.discriminator_train_step]
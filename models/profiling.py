@@ -0,0 +1,149 @@
+import tensorflow as tf
+import collections
+import contextlib
+import json
+import os
+import re
+import time
+from tensorflow.python.client import timeline
+
+
+class Profiler(object):
+    ''' step-level profiler for training loops
+
+        accumulates wall time of phases (e.g. train, summary, checkpoint),
+        and on traced steps runs with FULL_TRACE, writes chrome trace timelines
+        (open in chrome://tracing) and per-op cost summaries grouped by network layer.
+        untraced runs are plain session.run calls without RunOptions or extra fetches.
+        if not enabled, phases are not timed and runs are never traced
+    '''
+
+    # forward ops are grouped by "{generator|discriminator}/layer_i",
+    # backward ops (under "gradients") are grouped separately.
+    # reused networks get name scopes with suffixes (e.g. "discriminator_1" for fakes)
+    layer_pattern = re.compile(r"(generator|discriminator)(?:_\d+)?/layer_(\d+)")
+
+    def __init__(self, directory, name, enabled=True):
+
+        self.directory = directory
+        self.name = name
+        self.enabled = enabled
+        self.phase_times = collections.OrderedDict()
+
+        if self.enabled and not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+
+    @contextlib.contextmanager
+    def phase(self, name):
+
+        if not self.enabled:
+            yield
+            return
+
+        start = time.time()
+        yield
+        stop = time.time()
+
+        self.phase_times[name] = self.phase_times.get(name, 0.0) + (stop - start)
+
+    def run(self, session, fetches, feed_dict, global_step, trace=False, phase="train"):
+        ''' session.run timed as `phase`, and traced if `trace` is True '''
+
+        if not (self.enabled and trace):
+
+            with self.phase(phase):
+                return session.run(fetches, feed_dict=feed_dict)
+
+        run_metadata = tf.RunMetadata()
+
+        with self.phase(phase):
+            results = session.run(
+                fetches=fetches,
+                feed_dict=feed_dict,
+                options=tf.RunOptions(trace_level=tf.RunOptions.FULL_TRACE),
+                run_metadata=run_metadata
+            )
+
+        self.write_timeline(run_metadata, global_step)
+        self.write_op_costs(run_metadata, global_step)
+
+        return results
+
+    def write_timeline(self, run_metadata, global_step):
+
+        filename = os.path.join(self.directory, "timeline_{}.json".format(global_step))
+
+        with open(filename, "w") as file:
+            file.write(timeline.Timeline(run_metadata.step_stats).generate_chrome_trace_format())
+
+        print("{} saved".format(filename))
+
+    def op_costs(self, run_metadata):
+        ''' total op time in milliseconds for each group of ops, summed over devices
+
+            groups are "{name}/generator/layer_i", "{name}/discriminator/layer_i"
+            (with " (backward)" for gradient ops), "optimizer", "input" and "other".
+            GPU kernels are also reported per stream ("stream:all", "stream:N"),
+            those views are skipped so that each kernel is counted once
+        '''
+
+        costs = collections.Counter()
+
+        for device_stats in run_metadata.step_stats.dev_stats:
+
+            if "/stream:" in device_stats.device:
+                continue
+
+            for node_stats in device_stats.node_stats:
+
+                match = self.layer_pattern.search(node_stats.node_name)
+
+                if match:
+
+                    group = "{}/{}/layer_{}".format(self.name, *match.groups())
+
+                    if "gradients" in node_stats.node_name:
+                        group += " (backward)"
+
+                elif "Adam" in node_stats.node_name or "LossScale" in node_stats.node_name:
+
+                    group = "optimizer"
+
+                elif "Iterator" in node_stats.node_name:
+
+                    group = "input"
+
+                else:
+
+                    group = "other"
+
+                costs[group] += (node_stats.op_end_rel_micros - node_stats.op_start_rel_micros) / 1000.0
+
+        return costs
+
+    def write_op_costs(self, run_metadata, global_step):
+
+        costs = self.op_costs(run_metadata)
+
+        filename = os.path.join(self.directory, "op_costs_{}.json".format(global_step))
+
+        with open(filename, "w") as file:
+            json.dump(collections.OrderedDict(costs.most_common()), file, indent=4)
+
+        for group, cost in costs.most_common(10):
+            print("global_step: {}, {}: {:.2f} ms".format(global_step, group, cost))
+
+    def phase_summary(self, num_steps):
+        ''' mean wall time per step of each phase in milliseconds since the last call '''
+
+        summary = tf.Summary(value=[
+            tf.Summary.Value(tag="profile/{}_ms".format(name), simple_value=phase_time * 1000.0 / num_steps)
+            for name, phase_time in self.phase_times.items()
+        ])
+
+        for name, phase_time in self.phase_times.items():
+            print("{}: {:.2f} ms/step".format(name, phase_time * 1000.0 / num_steps))
+
+        self.phase_times.clear()
+
+        return summary
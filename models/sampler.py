@@ -0,0 +1,219 @@
+import tensorflow as tf
+import numpy as np
+import collections
+import threading
+import os
+import cv2
+from concurrent import futures
+
+
+class Sampler(object):
+    ''' batched inference of trained generator
+
+        builds only the generator of a model named `name`
+        and restores only "{name}/generator" variables from its checkpoint,
+        either the variables themselves or their exponential moving averages.
+        if a discriminator is given, its logits of fakes are also built (fake_logits)
+        in inference mode, so that a discriminator with cache_spectral_normalization
+        reads its cached normalized kernels (the model must be trained with it)
+    '''
+
+    class Format:
+        PNG, JPEG, NPY, TFRECORD = range(4)
+
+    def __init__(self, generator, latent_size, data_format, name="gan", discriminator=None):
+
+        with tf.variable_scope(name):
+
+            self.name = name
+            self.generator = generator
+            self.latent_size = latent_size
+
+            self.latents = tf.placeholder(
+                dtype=tf.float32,
+                shape=[None, self.latent_size],
+                name="latents"
+            )
+
+            self.fakes = generator(
+                inputs=self.latents,
+                training=False,
+                name="generator"
+            )
+
+            if discriminator:
+
+                self.fake_logits = discriminator(
+                    inputs=self.fakes,
+                    training=False,
+                    name="discriminator"
+                )
+
+                self.fake_logits = tf.identity(self.fake_logits, name="fake_logits")
+
+            else:
+
+                self.fake_logits = None
+
+            if data_format == "channels_first":
+
+                self.fakes = tf.transpose(self.fakes, [0, 2, 3, 1])
+
+            self.fakes = tf.identity(self.fakes, name="fakes")
+
+            self.images = tf.image.convert_image_dtype(self.fakes, tf.uint8, saturate=True)
+            self.images = tf.identity(self.images, name="images")
+
+            variables = tf.global_variables(scope="{}/generator".format(self.name))
+
+            if discriminator:
+                variables += tf.global_variables(scope="{}/discriminator".format(self.name))
+
+            self.saver = tf.train.Saver(
+                var_list=variables
+            )
+
+            # restores averages saved by a model trained with ema_decay into trainable variables,
+            # non-trainable variables (e.g. moving statistics of batch normalization) are restored as they are
+            trainable_variables = tf.trainable_variables(scope="{}/generator".format(self.name))
+
+            self.ema_saver = tf.train.Saver(
+                var_list={
+                    "{}/ExponentialMovingAverage".format(variable.op.name) if variable in trainable_variables else variable.op.name: variable
+                    for variable in variables
+                }
+            )
+
+    def restore(self, checkpoint_dir=None, ema=False):
+
+        session = tf.get_default_session()
+
+        checkpoint = tf.train.latest_checkpoint(checkpoint_dir or self.name)
+
+        if not checkpoint:
+            raise ValueError("No checkpoint found in {}".format(checkpoint_dir or self.name))
+
+        saver = self.ema_saver if ema else self.saver
+        saver.restore(session, checkpoint)
+        print(checkpoint, "loaded{}".format(" (exponential moving averages)" if ema else ""))
+
+    def sample(self, num_images, batch_size, seed=0):
+        ''' generate images in batches
+
+            latents are drawn from a random state seeded by `seed`,
+            so that the same seed always gives the same images
+            yields (offset, images) where images are uint8 NHWC RGB arrays
+        '''
+
+        session = tf.get_default_session()
+
+        random_state = np.random.RandomState(seed)
+
+        for offset in range(0, num_images, batch_size):
+
+            latents = random_state.randn(min(batch_size, num_images - offset), self.latent_size)
+
+            yield offset, session.run(self.images, feed_dict={self.latents: latents})
+
+    def save(self, filename, num_images, batch_size, seed=0, format=Format.PNG, num_threads=8):
+        ''' generate images and write them to disk
+
+            filename: output directory for PNG and JPEG, output file for NPY and TFRECORD
+            encoding and writing run on a thread pool,
+            so that the generator doesn't wait for I/O
+        '''
+
+        def encode(image):
+
+            extension = ".png" if format in [Sampler.Format.PNG, Sampler.Format.TFRECORD] else ".jpg"
+
+            return cv2.imencode(extension, cv2.cvtColor(image, cv2.COLOR_RGB2BGR))[1].tobytes()
+
+        def write_image(index, image):
+
+            extension = "png" if format == Sampler.Format.PNG else "jpg"
+
+            with open(os.path.join(filename, "{:06d}.{}".format(index, extension)), "wb") as f:
+                f.write(encode(image))
+
+        def write_record(image):
+
+            record = tf.train.Example(
+                features=tf.train.Features(
+                    feature={
+                        "image": tf.train.Feature(
+                            bytes_list=tf.train.BytesList(
+                                value=[encode(image)]
+                            )
+                        )
+                    }
+                )
+            ).SerializeToString()
+
+            with lock:
+                writer.write(record)
+
+        def write_array(offset, images):
+
+            memmap[offset:offset + len(images)] = images
+
+        if format in [Sampler.Format.PNG, Sampler.Format.JPEG]:
+
+            if not os.path.exists(filename):
+                os.makedirs(filename)
+
+        elif format == Sampler.Format.NPY:
+
+            memmap = np.lib.format.open_memmap(
+                filename=filename,
+                mode="w+",
+                dtype=np.uint8,
+                shape=tuple([num_images] + self.images.shape.as_list()[1:])
+            )
+
+        elif format == Sampler.Format.TFRECORD:
+
+            lock = threading.Lock()
+            writer = tf.python_io.TFRecordWriter(filename)
+
+        else:
+            raise ValueError("Invalid format")
+
+        # bound pending writes to keep memory flat when I/O is slower than generator
+        max_pending = num_threads * batch_size
+        pending = collections.deque()
+
+        with futures.ThreadPoolExecutor(num_threads) as executor:
+
+            for offset, images in self.sample(num_images, batch_size, seed):
+
+                if format in [Sampler.Format.PNG, Sampler.Format.JPEG]:
+
+                    pending.extend(
+                        executor.submit(write_image, offset + index, image)
+                        for index, image in enumerate(images)
+                    )
+
+                elif format == Sampler.Format.NPY:
+
+                    pending.append(executor.submit(write_array, offset, images))
+
+                elif format == Sampler.Format.TFRECORD:
+
+                    pending.extend(executor.submit(write_record, image) for image in images)
+
+                while len(pending) > max_pending:
+                    pending.popleft().result()
+
+            while pending:
+                pending.popleft().result()
+
+        if format == Sampler.Format.NPY:
+
+            memmap.flush()
+
+        elif format == Sampler.Format.TFRECORD:
+
+            writer.close()
+
+        print("{} images saved to {}".format(num_images, filename))
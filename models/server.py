@@ -0,0 +1,212 @@
+import numpy as np
+import collections
+import threading
+import socketserver
+import base64
+import queue
+import json
+import time
+import cv2
+from concurrent import futures
+from http import server
+
+
+class Batcher(object):
+    ''' dynamic batching of generation requests
+
+        concurrent requests are merged into one session.run
+        of up to max_batch_size latents, waiting at most max_wait seconds
+        for more requests after the first one arrives
+    '''
+
+    def __init__(self, sampler, session, max_batch_size=256, max_wait=0.01):
+
+        self.sampler = sampler
+        self.session = session
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.batch_size_histogram = collections.Counter()
+        self.num_requests = 0
+        self.num_images = 0
+        self.num_batches = 0
+
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def generate(self, latents):
+        ''' generate uint8 NHWC RGB images from latents, blocks until done '''
+
+        requests = [
+            (latents[offset:offset + self.max_batch_size], futures.Future())
+            for offset in range(0, len(latents), self.max_batch_size)
+        ]
+
+        with self.lock:
+            self.num_requests += 1
+
+        for request in requests:
+            self.queue.put(request)
+
+        return np.concatenate([future.result() for _, future in requests], axis=0)
+
+    def run(self):
+
+        pending = None
+
+        while True:
+
+            requests = [pending or self.queue.get()]
+            batch_size = len(requests[0][0])
+            pending = None
+
+            deadline = time.time() + self.max_wait
+
+            while batch_size < self.max_batch_size:
+
+                timeout = deadline - time.time()
+
+                if timeout <= 0:
+                    break
+
+                try:
+                    request = self.queue.get(timeout=timeout)
+
+                except queue.Empty:
+                    break
+
+                if batch_size + len(request[0]) > self.max_batch_size:
+                    pending = request
+                    break
+
+                requests.append(request)
+                batch_size += len(request[0])
+
+            #========================================================================#
+            # every future in the batch is resolved, with images or with the error,
+            # so that no request waits forever and the batching thread keeps running
+            #========================================================================#
+            try:
+                images = self.session.run(
+                    self.sampler.images,
+                    feed_dict={self.sampler.latents: np.concatenate([latents for latents, _ in requests], axis=0)}
+                )
+
+                offset = 0
+
+                for latents, future in requests:
+                    future.set_result(images[offset:offset + len(latents)])
+                    offset += len(latents)
+
+            except Exception as exception:
+
+                for _, future in requests:
+                    if not future.done():
+                        future.set_exception(exception)
+
+                continue
+
+            with self.lock:
+                # power-of-two buckets
+                self.batch_size_histogram[1 << (batch_size - 1).bit_length()] += 1
+                self.num_images += batch_size
+                self.num_batches += 1
+
+    def stats(self):
+
+        with self.lock:
+
+            return dict(
+                queue_depth=self.queue.qsize(),
+                num_requests=self.num_requests,
+                num_images=self.num_images,
+                num_batches=self.num_batches,
+                batch_size_histogram={
+                    "<={}".format(bucket): count
+                    for bucket, count in sorted(self.batch_size_histogram.items())
+                }
+            )
+
+
+class Server(socketserver.ThreadingMixIn, server.HTTPServer):
+    ''' local HTTP server for image generation
+
+        POST /generate {"seed": int, "num_images": int} or {"latents": [[float]]}
+        optionally with "format": "png" or "jpeg"
+        -> {"images": [base64 encoded image]}
+
+        GET /stats
+        -> {"queue_depth": int, "batch_size_histogram": {bucket: count}, ...}
+    '''
+
+    daemon_threads = True
+
+    def __init__(self, address, batcher):
+
+        self.batcher = batcher
+
+        server.HTTPServer.__init__(self, address, Handler)
+
+
+class Handler(server.BaseHTTPRequestHandler):
+
+    def send_json(self, code, content):
+
+        body = json.dumps(content).encode("utf-8")
+
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+
+        if self.path != "/stats":
+            return self.send_json(404, dict(error="Not found"))
+
+        self.send_json(200, self.server.batcher.stats())
+
+    def do_POST(self):
+
+        if self.path != "/generate":
+            return self.send_json(404, dict(error="Not found"))
+
+        latent_size = self.server.batcher.sampler.latent_size
+
+        try:
+            request = json.loads(self.rfile.read(int(self.headers["Content-Length"])).decode("utf-8"))
+
+            if "latents" in request:
+                latents = np.asarray(request["latents"], dtype=np.float32).reshape([-1, latent_size])
+
+            else:
+                random_state = np.random.RandomState(request.get("seed", 0))
+                latents = random_state.randn(int(request.get("num_images", 1)), latent_size)
+
+            extension = dict(png=".png", jpeg=".jpg")[request.get("format", "png")]
+
+        except (ValueError, KeyError, TypeError) as exception:
+            return self.send_json(400, dict(error=str(exception)))
+
+        if not len(latents):
+            return self.send_json(400, dict(error="No images requested"))
+
+        try:
+            images = self.server.batcher.generate(latents)
+
+            encoded_images = [
+                base64.b64encode(cv2.imencode(extension, cv2.cvtColor(image, cv2.COLOR_RGB2BGR))[1].tobytes()).decode("ascii")
+                for image in images
+            ]
+
+        except (ValueError, TypeError) as exception:
+            return self.send_json(400, dict(error=str(exception)))
+
+        except Exception as exception:
+            return self.send_json(500, dict(error="{}: {}".format(type(exception).__name__, exception)))
+
+        self.send_json(200, dict(images=encoded_images))
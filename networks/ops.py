@@ -1,4 +1,6 @@
 import tensorflow as tf
+import functools
+import weakref
 
 
 def channels_first(data_format):
@@ -21,26 +23,53 @@ def data_format_abbr(data_format):
     return "NCHW" if channels_first(data_format) else "NHWC"
 
 
-def spectral_normalization(input, name="spectral_normalization", reuse=None):
+# normalized kernels built so far, per graph and device, so that every discriminator call
+# on the same variable in a tower shares one power iteration chain and one update of `u`,
+# while towers on other devices build their own next to their ops
+_normalized_kernels = weakref.WeakKeyDictionary()
+
+
+def spectral_normalization(input, power_iteration_rounds=1, cache=False, training=None,
+                           name="spectral_normalization", reuse=None):
     ''' spectral normalization
         [Spectral Normalization for Generative Adversarial Networks]
         (https://arxiv.org/pdf/1802.05957.pdf)
         this implementation is from google
         (https://github.com/google/compare_gan/blob/master/compare_gan/src/gans/ops.py)
+
+        input must be a variable.
+        the normalized kernel is built once per graph and device for each variable,
+        later calls on the same device return the same tensor.
+        if cache is True, the normalized kernel is also stored in a non-trainable variable
+        every time it is recomputed, and inference (training=False) reads that variable
+        instead of running the power iteration.
     '''
 
     if len(input.shape) < 2:
         raise ValueError("Spectral norm can only be applied to multi-dimensional tensors")
 
-    with tf.variable_scope(name, reuse=reuse):
+    if power_iteration_rounds < 1:
+        raise ValueError("Spectral norm needs at least one power iteration round")
+
+    frozen = cache and training is False
+
+    # The paper says to flatten convnet kernel weights from (C_out, C_in, KH, KW)
+    # to (C_out, C_in * KH * KW). But Sonnet's and Compare_gan's Conv2D kernel
+    # weight shape is (KH, KW, C_in, C_out), so it should be reshaped to
+    # (KH * KW * C_in, C_out), and similarly for other layers that put output
+    # channels as last dimension.
+    # n.b. this means that w here is equivalent to w.T in the paper.
+    # w is placed by the enclosing tf.device, which also gives the device of the memo.
+    w = tf.reshape(input, [-1, input.shape[-1]])
 
-        # The paper says to flatten convnet kernel weights from (C_out, C_in, KH, KW)
-        # to (C_out, C_in * KH * KW). But Sonnet's and Compare_gan's Conv2D kernel
-        # weight shape is (KH, KW, C_in, C_out), so it should be reshaped to
-        # (KH * KW * C_in, C_out), and similarly for other layers that put output
-        # channels as last dimension.
-        # n.b. this means that w here is equivalent to w.T in the paper.
-        w = tf.reshape(input, [-1, input.shape[-1]])
+    normalized_kernels = _normalized_kernels.setdefault(tf.get_default_graph(), {})
+    key = (input.name, w.device, power_iteration_rounds, cache, frozen)
+
+    if key in normalized_kernels:
+
+        return normalized_kernels[key]
+
+    with tf.variable_scope(name, reuse=reuse):
 
         # Persisted approximation of first left singular vector of matrix `w`.
 
@@ -53,12 +82,30 @@ def spectral_normalization(input, name="spectral_normalization", reuse=None):
         )
         u = u_var
 
+        if cache:
+
+            # Normalized kernel as of the last training step.
+            # It starts from the initial kernel divided by its exact largest singular value,
+            # so that it is a valid normalized kernel before the first training step.
+            initial_value = input.initialized_value()
+            initial_norm = tf.svd(tf.reshape(initial_value, [-1, input.shape[-1]]), compute_uv=False)[0]
+
+            w_var = tf.get_variable(
+                name="w_var",
+                initializer=initial_value / initial_norm,
+                trainable=False
+            )
+
+            if frozen:
+
+                normalized_kernels[key] = w_var.read_value()
+                return normalized_kernels[key]
+
         # Use power iteration method to approximate spectral norm.
         # The authors suggest that "one round of power iteration was sufficient in the
         # actual experiment to achieve satisfactory performance". According to
         # observation, the spectral norm become very accurate after ~20 steps.
 
-        power_iteration_rounds = 1
         for _ in range(power_iteration_rounds):
             # `v` approximates the first right singular vector of matrix `w`.
             v = tf.nn.l2_normalize(tf.matmul(tf.transpose(w), u), dim=None, epsilon=1e-12)
@@ -83,10 +130,19 @@ def spectral_normalization(input, name="spectral_normalization", reuse=None):
 
         # Unflatten normalized weights to match the unnormalized tensor.
         w_tensor_normalized = tf.reshape(w_normalized, input.shape)
+
+        if cache:
+
+            # Refresh cached kernel whenever it is recomputed (once per training step).
+            with tf.control_dependencies([tf.assign(w_var, w_tensor_normalized, name="update_w")]):
+                w_tensor_normalized = tf.identity(w_tensor_normalized)
+
+        normalized_kernels[key] = w_tensor_normalized
         return w_tensor_normalized
 
 
-def dense(inputs, units, apply_spectral_normalization=False, name="dense", reuse=None):
+def dense(inputs, units, apply_spectral_normalization=False, power_iteration_rounds=1,
+          cache_spectral_normalization=False, training=None, name="dense", reuse=None):
     ''' linear layer for spectral normalization
         for weight normalization, use variable instead of tf.layers.dense
     '''
@@ -109,7 +165,12 @@ def dense(inputs, units, apply_spectral_normalization=False, name="dense", reuse
 
         if apply_spectral_normalization:
 
-            weight = spectral_normalization(weight)
+            weight = spectral_normalization(
+                input=weight,
+                power_iteration_rounds=power_iteration_rounds,
+                cache=cache_spectral_normalization,
+                training=training
+            )
 
         bias = tf.get_variable(
             name="bias",
@@ -119,13 +180,18 @@ def dense(inputs, units, apply_spectral_normalization=False, name="dense", reuse
             trainable=True
         )
 
+        # variables are kept in float32, compute in dtype of inputs
+        weight = tf.cast(weight, inputs.dtype)
+        bias = tf.cast(bias, inputs.dtype)
+
         inputs = tf.matmul(inputs, weight) + bias
 
         return inputs
 
 
 def conv2d(inputs, filters, kernel_size, strides, data_format,
-           apply_spectral_normalization=False, name="conv2d", reuse=None):
+           apply_spectral_normalization=False, power_iteration_rounds=1,
+           cache_spectral_normalization=False, training=None, name="conv2d", reuse=None):
     ''' convolution layer for spectral normalization
         for weight normalization, use variable instead of tf.layers.conv2d
     '''
@@ -150,7 +216,15 @@ def conv2d(inputs, filters, kernel_size, strides, data_format,
 
         if apply_spectral_normalization:
 
-            kernel = spectral_normalization(kernel)
+            kernel = spectral_normalization(
+                input=kernel,
+                power_iteration_rounds=power_iteration_rounds,
+                cache=cache_spectral_normalization,
+                training=training
+            )
+
+        # variables are kept in float32, compute in dtype of inputs
+        kernel = tf.cast(kernel, inputs.dtype)
 
         strides = [1] + [1] + strides if channels_first(data_format) else [1] + strides + [1]
 
@@ -172,7 +246,7 @@ def conv2d(inputs, filters, kernel_size, strides, data_format,
 
         inputs = tf.nn.bias_add(
             value=inputs,
-            bias=bias,
+            bias=tf.cast(bias, inputs.dtype),
             data_format=data_format_abbr(data_format)
         )
 
@@ -180,7 +254,8 @@ def conv2d(inputs, filters, kernel_size, strides, data_format,
 
 
 def deconv2d(inputs, filters, kernel_size, strides, data_format,
-             apply_spectral_normalization=False, name="deconv2d", reuse=None):
+             apply_spectral_normalization=False, power_iteration_rounds=1,
+             cache_spectral_normalization=False, training=None, name="deconv2d", reuse=None):
     ''' deconvolution layer for spectral normalization
         for weight normalization, use variable instead of tf.layers.conv2d_transpose
     '''
@@ -205,7 +280,15 @@ def deconv2d(inputs, filters, kernel_size, strides, data_format,
 
         if apply_spectral_normalization:
 
-            kernel = spectral_normalization(kernel)
+            kernel = spectral_normalization(
+                input=kernel,
+                power_iteration_rounds=power_iteration_rounds,
+                cache=cache_spectral_normalization,
+                training=training
+            )
+
+        # variables are kept in float32, compute in dtype of inputs
+        kernel = tf.cast(kernel, inputs.dtype)
 
         strides = [1] + [1] + strides if channels_first(data_format) else [1] + strides + [1]
 
@@ -232,7 +315,7 @@ def deconv2d(inputs, filters, kernel_size, strides, data_format,
 
         inputs = tf.nn.bias_add(
             value=inputs,
-            bias=bias,
+            bias=tf.cast(bias, inputs.dtype),
             data_format=data_format_abbr(data_format)
         )
 
@@ -240,6 +323,7 @@ def deconv2d(inputs, filters, kernel_size, strides, data_format,
 
 
 def residual_block(inputs, filters, strides, data_format, apply_spectral_normalization=False,
+                   power_iteration_rounds=1, cache_spectral_normalization=False,
                    normalization=None, training=None, activation=None, name="residual_block", reuse=None):
     ''' preactivation building residual block for spectral normalization
 
@@ -270,6 +354,9 @@ def residual_block(inputs, filters, strides, data_format, apply_spectral_normali
             strides=strides,
             data_format=data_format,
             apply_spectral_normalization=apply_spectral_normalization,
+            power_iteration_rounds=power_iteration_rounds,
+            cache_spectral_normalization=cache_spectral_normalization,
+            training=training,
             name="projection"
         )
 
@@ -280,6 +367,9 @@ def residual_block(inputs, filters, strides, data_format, apply_spectral_normali
             strides=strides,
             data_format=data_format,
             apply_spectral_normalization=apply_spectral_normalization,
+            power_iteration_rounds=power_iteration_rounds,
+            cache_spectral_normalization=cache_spectral_normalization,
+            training=training,
             name="conv2d_0"
         )
 
@@ -303,6 +393,9 @@ def residual_block(inputs, filters, strides, data_format, apply_spectral_normali
             strides=[1, 1],
             data_format=data_format,
             apply_spectral_normalization=apply_spectral_normalization,
+            power_iteration_rounds=power_iteration_rounds,
+            cache_spectral_normalization=cache_spectral_normalization,
+            training=training,
             name="conv2d_1"
         )
 
@@ -321,27 +414,33 @@ def unpooling2d(inputs, pool_size, data_format, dynamic=False):
         (https://github.com/tensorflow/tensorflow/issues/2169)
 
         my implementation is better
+        both data formats are handled natively without transpose
     '''
 
-    if data_format == "channels_last":
-        inputs = tf.transpose(inputs, perm=[0, 3, 1, 2])
-
     shape = tf.shape(inputs) if dynamic else inputs.shape.as_list()
 
-    inputs = tf.reshape(inputs, shape=[-1, shape[1], shape[2] * shape[3], 1])
+    if channels_first(data_format):
 
-    paddings = [[0, 0], [0, 0], [0, 0], [0, pool_size[1] - 1]]
-    inputs = tf.pad(inputs, paddings=paddings, mode="CONSTANT", constant_values=0)
+        inputs = tf.reshape(inputs, shape=[-1, shape[1], shape[2] * shape[3], 1])
 
-    inputs = tf.reshape(inputs, shape=[-1, shape[1], shape[2], shape[3] * pool_size[1]])
+        paddings = [[0, 0], [0, 0], [0, 0], [0, pool_size[1] - 1]]
+        inputs = tf.pad(inputs, paddings=paddings, mode="CONSTANT", constant_values=0)
 
-    paddings = [[0, 0], [0, 0], [0, 0], [0, shape[3] * pool_size[1] * (pool_size[0] - 1)]]
-    inputs = tf.pad(inputs, paddings=paddings, mode="CONSTANT", constant_values=0)
+        inputs = tf.reshape(inputs, shape=[-1, shape[1], shape[2], shape[3] * pool_size[1]])
 
-    inputs = tf.reshape(inputs, shape=[-1, shape[1], shape[2] * pool_size[0], shape[3] * pool_size[1]])
+        paddings = [[0, 0], [0, 0], [0, 0], [0, shape[3] * pool_size[1] * (pool_size[0] - 1)]]
+        inputs = tf.pad(inputs, paddings=paddings, mode="CONSTANT", constant_values=0)
 
-    if data_format == "channels_last":
-        inputs = tf.transpose(inputs, perm=[0, 2, 3, 1])
+        inputs = tf.reshape(inputs, shape=[-1, shape[1], shape[2] * pool_size[0], shape[3] * pool_size[1]])
+
+    else:
+
+        inputs = tf.reshape(inputs, shape=[-1, shape[1], 1, shape[2], 1, shape[3]])
+
+        paddings = [[0, 0], [0, 0], [0, pool_size[0] - 1], [0, 0], [0, pool_size[1] - 1], [0, 0]]
+        inputs = tf.pad(inputs, paddings=paddings, mode="CONSTANT", constant_values=0)
+
+        inputs = tf.reshape(inputs, shape=[-1, shape[1] * pool_size[0], shape[2] * pool_size[1], shape[3]])
 
     return inputs
 
@@ -351,21 +450,26 @@ def upsampling2d(inputs, factors, data_format, dynamic=False):
 
         this implementation is from nvidia
         (https://github.com/tkarras/progressive_growing_of_gans/blob/master/networks.py)
+        both data formats are handled natively without transpose
     '''
 
-    if data_format == "channels_last":
-        inputs = tf.transpose(inputs, perm=[0, 3, 1, 2])
-
     shape = tf.shape(inputs) if dynamic else inputs.shape.as_list()
 
-    inputs = tf.reshape(inputs, shape=[-1, shape[1], shape[2], 1, shape[3], 1])
+    if channels_first(data_format):
 
-    inputs = tf.tile(inputs, [1, 1, 1, factors[0], 1, factors[1]])
+        inputs = tf.reshape(inputs, shape=[-1, shape[1], shape[2], 1, shape[3], 1])
 
-    inputs = tf.reshape(inputs, shape=[-1, shape[1], shape[2] * factors[0], shape[3] * factors[1]])
+        inputs = tf.tile(inputs, [1, 1, 1, factors[0], 1, factors[1]])
 
-    if data_format == "channels_last":
-        inputs = tf.transpose(inputs, perm=[0, 2, 3, 1])
+        inputs = tf.reshape(inputs, shape=[-1, shape[1], shape[2] * factors[0], shape[3] * factors[1]])
+
+    else:
+
+        inputs = tf.reshape(inputs, shape=[-1, shape[1], 1, shape[2], 1, shape[3]])
+
+        inputs = tf.tile(inputs, [1, 1, factors[0], 1, factors[1], 1])
+
+        inputs = tf.reshape(inputs, shape=[-1, shape[1] * factors[0], shape[2] * factors[1], shape[3]])
 
     return inputs
 
@@ -393,6 +497,20 @@ def global_average_pooling2d(inputs, data_format):
     )
 
 
+def float32_normalization(normalization):
+    ''' normalize in float32 with float32 variables
+        and cast results back to dtype of inputs (e.g. float16)
+    '''
+
+    @functools.wraps(normalization)
+    def normalization_fn(inputs, *args, **kwargs):
+
+        return tf.cast(normalization(tf.cast(inputs, tf.float32), *args, **kwargs), inputs.dtype)
+
+    return normalization_fn
+
+
+@float32_normalization
 def batch_normalization(inputs, data_format, training, name="batch_normalization", reuse=None):
 
     return tf.contrib.layers.batch_norm(
@@ -407,6 +525,7 @@ def batch_normalization(inputs, data_format, training, name="batch_normalization
     )
 
 
+@float32_normalization
 def layer_normalization(inputs, data_format, training, name="layer_normalization", reuse=None):
 
     return tf.contrib.layers.layer_norm(
@@ -421,6 +540,7 @@ def layer_normalization(inputs, data_format, training, name="layer_normalization
     )
 
 
+@float32_normalization
 def instance_normalization(inputs, data_format, training, name="instance_normalization", reuse=None):
 
     return tf.contrib.layers.instance_norm(
@@ -70,15 +70,13 @@ class Generator(object):
                 name="dense_0"
             )
 
+            # reshape directly into data_format without transpose
             inputs = tf.reshape(
                 tensor=inputs,
-                shape=[-1, resolution, resolution, filters]
+                shape=([-1, filters, resolution, resolution] if self.data_format == "channels_first" else
+                       [-1, resolution, resolution, filters])
             )
 
-            if self.data_format == "channels_first":
-
-                inputs = tf.transpose(inputs, [0, 3, 1, 2])
-
             return inputs
 
     def deconv2d_block(self, inputs, index, training, name="deconv2d_block", reuse=None):
@@ -136,7 +134,8 @@ class Generator(object):
 
 class Discriminator(object):
 
-    def __init__(self, min_resolution, max_resolution, min_filters, max_filters, data_format):
+    def __init__(self, min_resolution, max_resolution, min_filters, max_filters, data_format,
+                 power_iteration_rounds=1, cache_spectral_normalization=False):
 
         if (max_resolution // min_resolution) != (max_filters // min_filters):
             raise ValueError("Invalid number of filters")
@@ -147,6 +146,10 @@ class Discriminator(object):
         self.max_filters = max_filters
         self.data_format = data_format
         self.num_layers = int(np.log2(max_resolution // min_resolution)) + 2
+        # either one number of power iteration rounds for all layers or one per layer
+        self.power_iteration_rounds = (power_iteration_rounds if isinstance(power_iteration_rounds, list) else
+                                       [power_iteration_rounds] * self.num_layers)
+        self.cache_spectral_normalization = cache_spectral_normalization
 
     def __call__(self, inputs, training, name="discriminator", reuse=None):
 
@@ -197,6 +200,9 @@ class Discriminator(object):
                 inputs=inputs,
                 units=1,
                 apply_spectral_normalization=True,
+                power_iteration_rounds=self.power_iteration_rounds[index],
+                cache_spectral_normalization=self.cache_spectral_normalization,
+                training=training,
                 name="dense_0"
             )
 
@@ -214,6 +220,8 @@ class Discriminator(object):
                 strides=[1, 1],
                 data_format=self.data_format,
                 apply_spectral_normalization=True,
+                power_iteration_rounds=self.power_iteration_rounds[index],
+                cache_spectral_normalization=self.cache_spectral_normalization,
                 normalization=None,
                 training=training,
                 activation=tf.nn.relu,
@@ -241,6 +249,9 @@ class Discriminator(object):
                 strides=[1, 1],
                 data_format=self.data_format,
                 apply_spectral_normalization=True,
+                power_iteration_rounds=self.power_iteration_rounds[index],
+                cache_spectral_normalization=self.cache_spectral_normalization,
+                training=training,
                 name="conv2d_0"
             )
 
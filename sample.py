@@ -0,0 +1,72 @@
+#=================================================================================================#
+# generate images with trained generator
+#
+# python sample.py --model_dir celeba_dcgan_model --num_images 50000 --format png --filename samples
+#=================================================================================================#
+
+import tensorflow as tf
+import argparse
+from models import sampler
+from networks import dcgan, resnet
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--model_dir", type=str, default="celeba_dcgan_model", help="model directory")
+parser.add_argument("--architecture", type=str, choices=["dcgan", "resnet"], default="dcgan", help="generator architecture")
+parser.add_argument("--resolution", type=int, default=64, help="image resolution")
+parser.add_argument("--min_filters", type=int, default=32, help="number of filters at max resolution")
+parser.add_argument("--max_filters", type=int, default=512, help="number of filters at min resolution")
+parser.add_argument("--latent_size", type=int, default=128, help="latent size")
+parser.add_argument('--data_format', type=str, choices=["channels_first", "channels_last"], default="channels_last", help="data_format")
+parser.add_argument("--num_images", type=int, default=10000, help="number of images to generate")
+parser.add_argument("--batch_size", type=int, default=500, help="batch size")
+parser.add_argument("--seed", type=int, default=0, help="random seed of latents")
+parser.add_argument("--format", type=str, choices=["png", "jpeg", "npy", "tfrecord"], default="png", help="output format")
+parser.add_argument("--filename", type=str, default="samples", help="output directory (png, jpeg) or file (npy, tfrecord)")
+parser.add_argument("--num_threads", type=int, default=8, help="number of threads to encode and write images")
+parser.add_argument('--gpu', type=str, default="0", help="gpu id")
+parser.add_argument("--ema", action="store_true", help="use exponential moving averages of generator variables")
+args = parser.parse_args()
+
+tf.logging.set_verbosity(tf.logging.INFO)
+
+networks = dict(dcgan=dcgan, resnet=resnet)
+
+gan_sampler = sampler.Sampler(
+    generator=networks[args.architecture].Generator(
+        min_resolution=4,
+        max_resolution=args.resolution,
+        min_filters=args.min_filters,
+        max_filters=args.max_filters,
+        data_format=args.data_format
+    ),
+    latent_size=args.latent_size,
+    data_format=args.data_format,
+    name=args.model_dir
+)
+
+config = tf.ConfigProto(
+    gpu_options=tf.GPUOptions(
+        visible_device_list=args.gpu,
+        allow_growth=True
+    ),
+    log_device_placement=False,
+    allow_soft_placement=True
+)
+
+with tf.Session(config=config) as session:
+
+    gan_sampler.restore(ema=args.ema)
+
+    gan_sampler.save(
+        filename=args.filename,
+        num_images=args.num_images,
+        batch_size=args.batch_size,
+        seed=args.seed,
+        format=dict(
+            png=sampler.Sampler.Format.PNG,
+            jpeg=sampler.Sampler.Format.JPEG,
+            npy=sampler.Sampler.Format.NPY,
+            tfrecord=sampler.Sampler.Format.TFRECORD
+        )[args.format],
+        num_threads=args.num_threads
+    )
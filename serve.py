@@ -0,0 +1,72 @@
+#=================================================================================================#
+# local HTTP server for image generation with dynamic request batching
+#
+# python serve.py --model_dir celeba_dcgan_model --port 8000
+# curl -d '{"seed": 0, "num_images": 4}' localhost:8000/generate
+# curl localhost:8000/stats
+#=================================================================================================#
+
+import tensorflow as tf
+import argparse
+from models import sampler, server
+from networks import dcgan, resnet
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--model_dir", type=str, default="celeba_dcgan_model", help="model directory")
+parser.add_argument("--architecture", type=str, choices=["dcgan", "resnet"], default="dcgan", help="generator architecture")
+parser.add_argument("--resolution", type=int, default=64, help="image resolution")
+parser.add_argument("--min_filters", type=int, default=32, help="number of filters at max resolution")
+parser.add_argument("--max_filters", type=int, default=512, help="number of filters at min resolution")
+parser.add_argument("--latent_size", type=int, default=128, help="latent size")
+parser.add_argument('--data_format', type=str, choices=["channels_first", "channels_last"], default="channels_last", help="data_format")
+parser.add_argument("--host", type=str, default="localhost", help="host to listen on")
+parser.add_argument("--port", type=int, default=8000, help="port to listen on")
+parser.add_argument("--max_batch_size", type=int, default=256, help="max number of images in one batch")
+parser.add_argument("--max_wait", type=float, default=0.01, help="max seconds to wait for more requests to batch")
+parser.add_argument('--gpu', type=str, default="0", help="gpu id")
+parser.add_argument("--ema", action="store_true", help="use exponential moving averages of generator variables")
+args = parser.parse_args()
+
+tf.logging.set_verbosity(tf.logging.INFO)
+
+networks = dict(dcgan=dcgan, resnet=resnet)
+
+gan_sampler = sampler.Sampler(
+    generator=networks[args.architecture].Generator(
+        min_resolution=4,
+        max_resolution=args.resolution,
+        min_filters=args.min_filters,
+        max_filters=args.max_filters,
+        data_format=args.data_format
+    ),
+    latent_size=args.latent_size,
+    data_format=args.data_format,
+    name=args.model_dir
+)
+
+config = tf.ConfigProto(
+    gpu_options=tf.GPUOptions(
+        visible_device_list=args.gpu,
+        allow_growth=True
+    ),
+    log_device_placement=False,
+    allow_soft_placement=True
+)
+
+with tf.Session(config=config) as session:
+
+    gan_sampler.restore(ema=args.ema)
+
+    gan_server = server.Server(
+        address=(args.host, args.port),
+        batcher=server.Batcher(
+            sampler=gan_sampler,
+            session=session,
+            max_batch_size=args.max_batch_size,
+            max_wait=args.max_wait
+        )
+    )
+
+    print("serving on {}:{}".format(args.host, args.port))
+
+    gan_server.serve_forever()